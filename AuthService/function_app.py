@@ -1,8 +1,9 @@
 import azure.functions as func
-import json, uuid, sys, os, requests
+import json, uuid, sys, os, threading, time, asyncio
+import aiohttp
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils.auth import issue_token, decode_token, get_bearer_token, require_user, require_role, error
+from utils.auth import issue_token, decode_token, get_bearer_token, require_user, require_role, error, issue_internal_identity, INTERNAL_IDENTITY_HEADER, get_jwks
 
 app = func.FunctionApp()
 
@@ -10,10 +11,213 @@ PRODUCT_SERVICE_URL = os.getenv("PRODUCT_SERVICE_URL")
 INVENTORY_SERVICE_URL = os.getenv("INVENTORY_SERVICE_URL")
 REPORT_SERVICE_URL = os.getenv("REPORT_SERVICE_URL")
 
-def proxy(method: str, service_url: str, path: str, token: str | None, body=None) -> func.HttpResponse:
+PROXY_CONNECT_TIMEOUT = float(os.getenv("PROXY_CONNECT_TIMEOUT", "3"))
+PROXY_READ_TIMEOUT = float(os.getenv("PROXY_READ_TIMEOUT", "30"))
+PROXY_POOL_SIZE = int(os.getenv("PROXY_POOL_SIZE", "20"))
+
+# Header yang tidak boleh diteruskan apa adanya (hop-by-hop / sudah di-handle aiohttp)
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers",
+    "transfer-encoding", "upgrade", "content-length", "content-encoding",
+}
+
+# Hedging untuk GET (idempotent): kirim attempt ke-2 kalau attempt pertama lebih lambat dari
+# threshold ini (set ke p95 latency downstream). 0 = nonaktif.
+HEDGE_AFTER_SEC = float(os.getenv("GW_HEDGE_AFTER_MS", "0")) / 1000
+hedge_stats = {"hedged": 0, "hedge_won": 0}
+
+sessions = {}  # service_url -> aiohttp.ClientSession (keep-alive pool per downstream)
+
+def get_session(service_url: str) -> aiohttp.ClientSession:
+    # Dibuat lazy di dalam event loop worker
+    session = sessions.get(service_url)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=PROXY_POOL_SIZE, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(connect=PROXY_CONNECT_TIMEOUT, sock_read=PROXY_READ_TIMEOUT),
+        )
+        sessions[service_url] = session
+    return session
+
+async def _send(method, url, session, headers, params, data):
+    async with session.request(method, url, headers=headers, params=params, data=data) as resp:
+        body = await resp.read()
+        return resp.status, resp.headers, body
+
+async def _hedged(make_attempt):
+    """Attempt pertama; kalau belum selesai setelah HEDGE_AFTER_SEC, kirim attempt kedua dan pakai yang duluan sukses."""
+    first = asyncio.ensure_future(make_attempt())
+    done, _ = await asyncio.wait({first}, timeout=HEDGE_AFTER_SEC)
+    if done:
+        return first.result()
+
+    hedge_stats["hedged"] += 1
+    second = asyncio.ensure_future(make_attempt())
+    pending = {first, second}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending: other.cancel()
+                if task is second: hedge_stats["hedge_won"] += 1
+                return task.result()
+    return first.result()  # dua-duanya gagal -> raise error attempt pertama
+
+async def proxy(method: str, service_url: str, path: str, token: str | None, body=None, claims=None, params=None) -> func.HttpResponse:
     headers = {"Authorization": token} if token else {}
-    resp = requests.request(method, f"{service_url}{path}", headers=headers, json=body)
-    return func.HttpResponse(resp.text, status_code=resp.status_code, mimetype="application/json")
+    identity = issue_internal_identity(claims) if claims else None
+    if identity:
+        headers[INTERNAL_IDENTITY_HEADER] = identity
+    data = None
+    if isinstance(body, (bytes, bytearray)):
+        # Body mentah dari client diteruskan tanpa parse/serialize ulang
+        headers["Content-Type"] = "application/json"
+        data = body or None
+    elif body is not None:
+        headers["Content-Type"] = "application/json"
+        data = json.dumps(body).encode("utf-8")
+
+    url, session, params = f"{service_url}{path}", get_session(service_url), dict(params or {})
+    attempt = lambda: _send(method, url, session, headers, params, data)
+    if method == "GET" and HEDGE_AFTER_SEC > 0:
+        status, resp_headers, content = await _hedged(attempt)
+    else:
+        status, resp_headers, content = await attempt()
+
+    out_headers = {k: v for k, v in resp_headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+    out_headers.setdefault("Content-Type", "application/json")
+    return func.HttpResponse(content, status_code=status, headers=out_headers)
+
+# ===== RESPONSE CACHE (GET, per tenant) =====
+# TTL per route (detik), 0 = tidak di-cache
+ROUTE_CACHE_TTL = {
+    "product/products": float(os.getenv("GW_CACHE_TTL_PRODUCTS", "5")),
+    "inventory": float(os.getenv("GW_CACHE_TTL_INVENTORY", "5")),
+    "report/run": float(os.getenv("GW_CACHE_TTL_REPORT", "30")),
+}
+GW_CACHE_MAX = int(os.getenv("GW_CACHE_MAX", "1000"))
+
+response_cache = {}     # (tenantId, generation, route, query) -> (expires_at, status, body, headers)
+inflight = {}           # key -> asyncio.Event (single-flight)
+tenant_generation = {}  # tenantId -> int, naik setiap ada write
+cache_lock = threading.Lock()
+
+def invalidate_tenant(tenant_id):
+    """Dipanggil setelah write diproxy: semua cache lama tenant ini jadi tidak terjangkau."""
+    with cache_lock:
+        tenant_generation[tenant_id] = tenant_generation.get(tenant_id, 0) + 1
+
+def _cached_response(entry, status_label):
+    expires_at, status, body, headers = entry
+    return func.HttpResponse(body, status_code=status, headers={**headers, "X-Cache": status_label})
+
+async def cached_proxy(claims, route: str, service_url: str, path: str, token: str | None, params=None) -> func.HttpResponse:
+    ttl = ROUTE_CACHE_TTL.get(route, 0)
+    if ttl <= 0:
+        return await proxy("GET", service_url, path, token, claims=claims, params=params)
+
+    tenant_id = claims["tenantId"]
+    while True:
+        with cache_lock:
+            generation = tenant_generation.get(tenant_id, 0)
+            key = (tenant_id, generation, route, tuple(sorted((params or {}).items())))
+            entry = response_cache.get(key)
+            if entry and entry[0] > time.monotonic():
+                return _cached_response(entry, "HIT")
+            flight = inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = inflight[key] = asyncio.Event()
+
+        if leader: break
+        # Request identik sedang dihitung -> tunggu hasilnya lalu cek cache lagi
+        try:
+            await asyncio.wait_for(flight.wait(), PROXY_READ_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    try:
+        resp = await proxy("GET", service_url, path, token, claims=claims, params=params)
+        if resp.status_code == 200:
+            entry = (time.monotonic() + ttl, resp.status_code, resp.get_body(), dict(resp.headers))
+            with cache_lock:
+                # Jangan simpan kalau ada write selama request berjalan
+                if tenant_generation.get(tenant_id, 0) == generation:
+                    now = time.monotonic()
+                    if len(response_cache) >= GW_CACHE_MAX:
+                        for k in [k for k, v in response_cache.items() if v[0] <= now]:
+                            del response_cache[k]
+                    if len(response_cache) >= GW_CACHE_MAX:
+                        response_cache.pop(next(iter(response_cache)))
+                    response_cache[key] = entry
+            return _cached_response(entry, "MISS")
+        return resp
+    finally:
+        with cache_lock:
+            inflight.pop(key, None)
+        flight.set()
+
+
+# ===== TENANT QUOTA (rate limit + concurrency per plan) =====
+PLAN_LIMITS = {
+    "Free":    {"rate": 5,  "burst": 10,  "concurrency": 2},
+    "Basic":   {"rate": 20, "burst": 40,  "concurrency": 5},
+    "Premium": {"rate": 50, "burst": 100, "concurrency": 20},
+}
+PLAN_LIMITS.update(json.loads(os.getenv("GW_PLAN_LIMITS", "{}")))
+TENANT_PLANS = json.loads(os.getenv("TENANT_PLANS", "{}"))  # {"T001": "Premium", ...}
+DEFAULT_PLAN = os.getenv("DEFAULT_PLAN", "Premium")
+
+class TenantQuota:
+    """Token bucket (request/detik) + batas request in-flight untuk satu tenant."""
+    def __init__(self, limits):
+        self.rate = float(limits["rate"])
+        self.capacity = float(limits["burst"])
+        self.max_inflight = int(limits["concurrency"])
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.inflight = 0
+
+    def try_acquire(self) -> float:
+        """Return 0 kalau boleh jalan, atau detik untuk Retry-After."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.inflight >= self.max_inflight:
+            return 1
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.inflight += 1
+        return 0
+
+tenant_quotas = {}  # tenantId -> TenantQuota
+quota_lock = threading.Lock()
+
+def get_tenant_plan(tenant_id: str) -> str:
+    return TENANT_PLANS.get(tenant_id, DEFAULT_PLAN)
+
+def get_plan_limits(tenant_id: str) -> dict:
+    return PLAN_LIMITS.get(get_tenant_plan(tenant_id), PLAN_LIMITS[DEFAULT_PLAN])
+
+async def limited(claims, call) -> func.HttpResponse:
+    """Jalankan coroutine call() di bawah kuota tenant; kalau penuh balas 429 + Retry-After."""
+    tenant_id = claims["tenantId"]
+    with quota_lock:
+        quota = tenant_quotas.get(tenant_id)
+        if quota is None:
+            quota = tenant_quotas[tenant_id] = TenantQuota(get_plan_limits(tenant_id))
+        wait = quota.try_acquire()
+    if wait:
+        return func.HttpResponse(
+            json.dumps({"error": "rate_limited"}), status_code=429, mimetype="application/json",
+            headers={"Retry-After": str(max(1, int(wait + 0.999)))}
+        )
+    try:
+        return await call()
+    finally:
+        with quota_lock:
+            quota.inflight -= 1
 
 
 # ===== AUTH =====
@@ -32,6 +236,12 @@ def login(req: func.HttpRequest):
     return func.HttpResponse(json.dumps({"token": token}), mimetype="application/json")
 
 
+@app.route(route="auth/.well-known/jwks.json", auth_level=func.AuthLevel.ANONYMOUS)
+def jwks(req: func.HttpRequest):
+    # Public key untuk verifikasi token di service lain (di-cache oleh JwksCache di utils/auth.py)
+    return func.HttpResponse(json.dumps(get_jwks()), mimetype="application/json", headers={"Cache-Control": "public, max-age=300"})
+
+
 @app.route(route="auth/me", auth_level=func.AuthLevel.ANONYMOUS)
 def me(req: func.HttpRequest):
     claims, resp = require_user(req)
@@ -44,83 +254,174 @@ def tenant_info(req: func.HttpRequest):
     token = get_bearer_token(req.headers.get("Authorization"))
     if not token: return error("token_required", 401)
     claims = decode_token(token)
-    return func.HttpResponse(json.dumps({
+    return func.HttpResponse(json.dumps(tenant_info_body(claims)), mimetype="application/json")
+
+def tenant_info_body(claims) -> dict:
+    return {
         "tenantId": claims["tenantId"],
         "storeName": f"Toko Demo {claims['tenantId']}",
-        "plan": "Premium"
-    }), mimetype="application/json")
+        "plan": get_tenant_plan(claims["tenantId"])
+    }
 
 
 # ===== GATEWAY → PRODUCT SERVICE =====
 @app.route(route="product/products", auth_level=func.AuthLevel.FUNCTION)
-def gw_products(req: func.HttpRequest):
+async def gw_products(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
-    return proxy("GET", PRODUCT_SERVICE_URL, "/product/products", req.headers.get("Authorization"))
+    return await limited(claims, lambda: cached_proxy(claims, "product/products", PRODUCT_SERVICE_URL, "/product/products", req.headers.get("Authorization"), req.params))
 
 
 @app.route(route="product/manage", auth_level=func.AuthLevel.FUNCTION)
-def gw_manage(req: func.HttpRequest):
+async def gw_manage(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
     if not require_role(claims, ["Owner"]): return error("owner_only", 403)
-    return proxy("GET", PRODUCT_SERVICE_URL, "/product/manage", req.headers.get("Authorization"))
+    return await limited(claims, lambda: proxy("GET", PRODUCT_SERVICE_URL, "/product/manage", req.headers.get("Authorization"), claims=claims, params=req.params))
 
 
 @app.route(route="product/create", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
-def gw_create(req: func.HttpRequest):
+async def gw_create(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
     if not require_role(claims, ["Owner"]): return error("owner_only", 403)
-    return proxy("POST", PRODUCT_SERVICE_URL, "/product/create", req.headers.get("Authorization"), req.get_json())
+    resp = await limited(claims, lambda: proxy("POST", PRODUCT_SERVICE_URL, "/product/create", req.headers.get("Authorization"), req.get_body(), claims=claims, params=req.params))
+    invalidate_tenant(claims["tenantId"])
+    return resp
 
 
 @app.route(route="product/update", methods=["PUT"], auth_level=func.AuthLevel.FUNCTION)
-def gw_update(req: func.HttpRequest):
+async def gw_update(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
     if not require_role(claims, ["Owner"]): return error("owner_only", 403)
-    return proxy("PUT", PRODUCT_SERVICE_URL, "/product/update", req.headers.get("Authorization"), req.get_json())
+    resp = await limited(claims, lambda: proxy("PUT", PRODUCT_SERVICE_URL, "/product/update", req.headers.get("Authorization"), req.get_body(), claims=claims, params=req.params))
+    invalidate_tenant(claims["tenantId"])
+    return resp
 
 
 @app.route(route="product/delete", methods=["DELETE"], auth_level=func.AuthLevel.FUNCTION)
-def gw_delete(req: func.HttpRequest):
+async def gw_delete(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
     if not require_role(claims, ["Owner"]): return error("owner_only", 403)
-    return proxy("DELETE", PRODUCT_SERVICE_URL, "/product/delete", req.headers.get("Authorization"), req.get_json())
+    resp = await limited(claims, lambda: proxy("DELETE", PRODUCT_SERVICE_URL, "/product/delete", req.headers.get("Authorization"), req.get_body(), claims=claims, params=req.params))
+    invalidate_tenant(claims["tenantId"])
+    return resp
 
 # ===== GATEWAY → INVENTORY SERVICE =====
 @app.route(route="inventory", auth_level=func.AuthLevel.FUNCTION)
-def gw_inventory(req: func.HttpRequest):
+async def gw_inventory(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
-    return proxy("GET", INVENTORY_SERVICE_URL, "/inventory", req.headers.get("Authorization"))
+    return await limited(claims, lambda: cached_proxy(claims, "inventory", INVENTORY_SERVICE_URL, "/inventory", req.headers.get("Authorization"), req.params))
 
 @app.route(route="inventory/create", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
-def gw_create_inventory(req: func.HttpRequest):
+async def gw_create_inventory(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
     if not require_role(claims, ["Owner"]): return error("owner_only", 403)
-    return proxy("POST", INVENTORY_SERVICE_URL, "/inventory/create", req.headers.get("Authorization"), req.get_json())
+    resp = await limited(claims, lambda: proxy("POST", INVENTORY_SERVICE_URL, "/inventory/create", req.headers.get("Authorization"), req.get_body(), claims=claims, params=req.params))
+    invalidate_tenant(claims["tenantId"])
+    return resp
 
 @app.route(route="inventory/update", methods=["PUT"], auth_level=func.AuthLevel.FUNCTION)
-def gw_update_inventory(req: func.HttpRequest):
+async def gw_update_inventory(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
     if not require_role(claims, ["Owner"]): return error("owner_only", 403)
-    return proxy("PUT", INVENTORY_SERVICE_URL, "/inventory/update", req.headers.get("Authorization"), req.get_json())
+    resp = await limited(claims, lambda: proxy("PUT", INVENTORY_SERVICE_URL, "/inventory/update", req.headers.get("Authorization"), req.get_body(), claims=claims, params=req.params))
+    invalidate_tenant(claims["tenantId"])
+    return resp
 
 @app.route(route="inventory/delete", methods=["DELETE"], auth_level=func.AuthLevel.FUNCTION)
-def gw_delete_inventory(req: func.HttpRequest):
+async def gw_delete_inventory(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
     if not require_role(claims, ["Owner"]): return error("owner_only", 403)
-    return proxy("DELETE", INVENTORY_SERVICE_URL, "/inventory/delete", req.headers.get("Authorization"), req.get_json())
+    resp = await limited(claims, lambda: proxy("DELETE", INVENTORY_SERVICE_URL, "/inventory/delete", req.headers.get("Authorization"), req.get_body(), claims=claims, params=req.params))
+    invalidate_tenant(claims["tenantId"])
+    return resp
 
 # ===== GATEWAY → REPORT SERVICE =====
 @app.route(route="report/run", auth_level=func.AuthLevel.FUNCTION)
-def gw_report_run(req: func.HttpRequest):
+async def gw_report_run(req: func.HttpRequest):
     claims, resp = require_user(req)
     if resp: return resp
-    return proxy("GET", REPORT_SERVICE_URL, "/report/run", req.headers.get("Authorization"))
\ No newline at end of file
+    return await limited(claims, lambda: cached_proxy(claims, "report/run", REPORT_SERVICE_URL, "/report/run", req.headers.get("Authorization"), req.params))
+
+# ===== BATCH (1x auth, 1 slot kuota, sub-request paralel sebatas concurrency plan) =====
+GW_BATCH_MAX = int(os.getenv("GW_BATCH_MAX", "20"))
+
+# path -> (service_url, route cache, owner_only); None = dijawab langsung dari claims
+BATCH_ROUTES = {
+    "auth/me": None,
+    "tenant/info": None,
+    "product/products": (PRODUCT_SERVICE_URL, "product/products", False),
+    "product/manage": (PRODUCT_SERVICE_URL, None, True),
+    "inventory": (INVENTORY_SERVICE_URL, "inventory", False),
+    "report/run": (REPORT_SERVICE_URL, "report/run", False),
+}
+
+async def _batch_item(claims, token, item) -> dict:
+    if not isinstance(item, dict):
+        return {"id": None, "status": 400, "body": {"error": "invalid_request_item"}}
+    item_id = item.get("id")
+    path, method, params = item.get("path") or "", item.get("method") or "GET", item.get("query") or {}
+    if not isinstance(path, str) or not isinstance(method, str) or not isinstance(params, dict):
+        return {"id": item_id, "status": 400, "body": {"error": "invalid_request_item"}}
+    path, method = path.strip("/"), method.upper()
+
+    if path not in BATCH_ROUTES:
+        return {"id": item_id, "status": 404, "body": {"error": "route_not_found"}}
+    if method != "GET":
+        return {"id": item_id, "status": 405, "body": {"error": "only_get_supported"}}
+    if path == "auth/me":
+        return {"id": item_id, "status": 200, "body": claims}
+    if path == "tenant/info":
+        return {"id": item_id, "status": 200, "body": tenant_info_body(claims)}
+
+    service_url, cache_route, owner_only = BATCH_ROUTES[path]
+    if owner_only and not require_role(claims, ["Owner"]):
+        return {"id": item_id, "status": 403, "body": {"error": "owner_only"}}
+    try:
+        # Kuota tenant sudah diambil sekali oleh gw_batch, item tidak lewat limited() lagi
+        if cache_route:
+            resp = await cached_proxy(claims, cache_route, service_url, f"/{path}", token, params)
+        else:
+            resp = await proxy("GET", service_url, f"/{path}", token, claims=claims, params=params)
+    except Exception as e:
+        return {"id": item_id, "status": 502, "body": {"error": f"upstream_error: {e}"}}
+
+    raw = resp.get_body()
+    try:
+        body = json.loads(raw) if raw else None
+    except ValueError:
+        body = raw.decode("utf-8", errors="replace")
+    return {"id": item_id, "status": resp.status_code, "body": body}
+
+@app.route(route="batch", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+async def gw_batch(req: func.HttpRequest):
+    claims, resp = require_user(req)
+    if resp: return resp
+    try:
+        items = req.get_json().get("requests", [])
+    except (ValueError, AttributeError):
+        return error("invalid_json", 400)
+    if not isinstance(items, list) or not items:
+        return error("requests_required", 400)
+    if len(items) > GW_BATCH_MAX:
+        return error(f"too_many_requests_in_batch (max {GW_BATCH_MAX})", 400)
+
+    token = req.headers.get("Authorization")
+
+    async def run_batch():
+        # Fan-out ke upstream dibatasi concurrency plan tenant (Free 2, Basic 5, ...)
+        sem = asyncio.Semaphore(max(1, int(get_plan_limits(claims["tenantId"])["concurrency"])))
+        async def run_item(item):
+            async with sem:
+                return await _batch_item(claims, token, item)
+        results = await asyncio.gather(*[run_item(item) for item in items])
+        return func.HttpResponse(json.dumps({"responses": results}), mimetype="application/json")
+
+    return await limited(claims, run_batch)
@@ -6,6 +6,9 @@ import json
 import os
 import uuid
 import datetime
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 app = func.FunctionApp()
 
@@ -17,11 +20,35 @@ CONTAINER_INVENTORY = "inventory_items"
 CONTAINER_LEDGER = "stock_ledger"       # <--- Container Baru untuk Riwayat
 SB_CONN_STR = os.environ.get("SERVICE_BUS_CONNECTION")
 TOPIC_NAME = "product-events"
+ALLOCATION_STRATEGY = os.environ.get("ALLOCATION_STRATEGY", "nearest")  # nearest | most_stock | split
+WAREHOUSE_PRIORITY = json.loads(os.environ.get("WAREHOUSE_PRIORITY", "{}"))  # {"JKT": ["WH-JKT", "WH-BDG"], "default": [...]}
+AVAILABILITY_CACHE_TTL_SEC = float(os.environ.get("AVAILABILITY_CACHE_TTL_SEC", "5"))
+ALLOCATION_MAX_RETRIES = int(os.environ.get("ALLOCATION_MAX_RETRIES", "3"))
+CONTAINER_EXPIRY_INDEX = "reservation_expiry_index"  # Partition Key: /bucket (menit expiry)
+RESERVATION_HOLD_MIN = float(os.environ.get("RESERVATION_HOLD_MIN", "1440"))
+RESERVATION_TTL_GRACE_SEC = int(os.environ.get("RESERVATION_TTL_GRACE_SEC", str(7 * 24 * 3600)))
+RESERVATION_BUCKET_MIN = int(os.environ.get("RESERVATION_BUCKET_MIN", "1"))
+SWEEP_MAX_BUCKETS = int(os.environ.get("SWEEP_MAX_BUCKETS", "120"))
+SWEEP_BATCH_SIZE = int(os.environ.get("SWEEP_BATCH_SIZE", "40"))  # reservasi per transactional batch (maks 100 operasi)
+SWEEP_MAX_WORKERS = int(os.environ.get("SWEEP_MAX_WORKERS", "8"))
+SWEEP_TIME_BUDGET_SEC = int(os.environ.get("SWEEP_TIME_BUDGET_SEC", "50"))
+SWEEP_MAX_BUCKET_ATTEMPTS = int(os.environ.get("SWEEP_MAX_BUCKET_ATTEMPTS", "5"))  # lalu bucket di-dead-letter
+if RESERVATION_BUCKET_MIN < 1:
+    raise ValueError("RESERVATION_BUCKET_MIN must be >= 1")
+REORDER_VELOCITY_DAYS = int(os.environ.get("REORDER_VELOCITY_DAYS", "30"))
+REORDER_LEAD_TIME_DAYS = int(os.environ.get("REORDER_LEAD_TIME_DAYS", "7"))
+REORDER_COVER_DAYS = int(os.environ.get("REORDER_COVER_DAYS", "14"))
+
+# Dokumen reservasi memakai TTL per item, yang hanya berlaku kalau default TTL container sudah aktif
+# (-1 = TTL aktif, item tanpa field ttl tidak pernah expire -> row stok tidak terpengaruh)
+CONTAINER_DEFAULT_TTL = {CONTAINER_INVENTORY: -1}
 
 client = None
 db_client = None
+availability_cache = {}  # sku -> (expires_at, rows per gudang)
+ttl_verified = set()     # container yang default TTL-nya sudah dicek di proses ini
 
-def get_container(container_name):
+def get_container(container_name, pk_path="/sku"):
     """Helper dinamis untuk mengambil container (Inventory atau Ledger)"""
     global client, db_client
     if not client:
@@ -34,13 +61,30 @@ def get_container(container_name):
             
     # Auto-create container jika belum ada (Biar tidak error 404)
     # Partition Key Ledger: /sku (Agar mudah tracking history per barang)
-    pk_path = "/sku"
-    return db_client.create_container_if_not_exists(id=container_name, partition_key=PartitionKey(path=pk_path))
+    default_ttl = CONTAINER_DEFAULT_TTL.get(container_name)
+    ctr = db_client.create_container_if_not_exists(id=container_name, partition_key=PartitionKey(path=pk_path), default_ttl=default_ttl)
+    if default_ttl is not None and container_name not in ttl_verified:
+        ensure_default_ttl(ctr, pk_path, default_ttl)
+    return ctr
+
+def ensure_default_ttl(ctr, pk_path, default_ttl):
+    """
+    create_container_if_not_exists tidak mengubah container yang sudah ada: container lama
+    tanpa default TTL membuat field ttl reservasi diabaikan -> aktifkan sekali per proses.
+    """
+    props = ctr.read()
+    if props.get("defaultTtl") is None:
+        logging.warning(f"[Inventory] Container {props['id']} has no default TTL, enabling defaultTtl={default_ttl}")
+        db_client.replace_container(
+            ctr, partition_key=PartitionKey(path=pk_path),
+            indexing_policy=props.get("indexingPolicy"), default_ttl=default_ttl
+        )
+    ttl_verified.add(props["id"])
 
 def get_iso_timestamp():
     return datetime.datetime.now(datetime.timezone.utc).isoformat()
 
-def create_ledger_entry(sku, warehouse_code, change_qty, balance_after, reason, product_name="", price={}, ref_id=""):
+def create_ledger_entry(sku, warehouse_code, change_qty, balance_after, reason, product_name="", price={}, ref_id="", tenant_id=None):
     """
     Fungsi Pembukuan: Mencatat setiap perubahan stok ke tabel stock_ledger.
     """
@@ -58,6 +102,8 @@ def create_ledger_entry(sku, warehouse_code, change_qty, balance_after, reason,
             "reference_id": ref_id,         # Order ID atau Note
             "timestamp": get_iso_timestamp()
         }
+        if tenant_id:
+            ledger_item["tenantId"] = tenant_id  # dipakai rollup / laporan per tenant
         
         ledger_ctr.create_item(body=ledger_item)
         logging.info(f"   [Ledger] Recorded: {sku} ({change_qty}) due to {reason}")
@@ -74,7 +120,7 @@ def publish_stock_event(sku, product_name):
     ctr = get_container(CONTAINER_INVENTORY)
     
     # Aggregate Stok
-    query = "SELECT * FROM c WHERE c.sku = @sku"
+    query = "SELECT * FROM c WHERE c.sku = @sku AND NOT IS_DEFINED(c.doc_type)"
     params = [{"name": "@sku", "value": sku}]
     items = list(ctr.query_items(query=query, parameters=params, enable_cross_partition_query=True))
     
@@ -112,6 +158,48 @@ def publish_stock_event(sku, product_name):
     except Exception as e:
         logging.error(f"[Inventory] Failed to publish stock event: {e}")
 
+def evaluate_low_stock(item):
+    """
+    Cek O(1) pada row yang sedang ditulis: quantity_available <= safety_stock.
+    Flag 'low_stock_alerted' disimpan di row yang sama -> event hanya dikirim saat transisi
+    normal -> low (dedup), dan di-reset saat stok kembali di atas safety_stock.
+    Return True kalau LOW_STOCK perlu di-publish SETELAH row berhasil disimpan.
+    """
+    is_low = item.get('quantity_available', 0) <= item.get('safety_stock', 0)
+    was_alerted = item.get('low_stock_alerted', False)
+    item['low_stock_alerted'] = is_low
+    if is_low and not was_alerted:
+        item['low_stock_seq'] = item.get('low_stock_seq', 0) + 1
+        return True
+    return False
+
+def publish_low_stock_event(item):
+    if not SB_CONN_STR: return
+
+    payload = {
+        "action": "LOW_STOCK",
+        "sku": item['sku'],
+        "data": {
+            "name": item.get('product_name'),
+            "warehouse_code": item['warehouse_code'],
+            "quantity_available": item.get('quantity_available', 0),
+            "safety_stock": item.get('safety_stock', 0),
+            "detected_at": item.get('last_updated')
+        }
+    }
+
+    try:
+        client = ServiceBusClient.from_connection_string(SB_CONN_STR)
+        with client:
+            sender = client.get_topic_sender(TOPIC_NAME)
+            with sender:
+                # message_id deterministik -> retry tidak dobel kalau duplicate detection aktif di topic
+                msg = ServiceBusMessage(json.dumps(payload), message_id=f"LOW_STOCK:{item['id']}:{item['low_stock_seq']}")
+                sender.send_messages(msg)
+        logging.info(f"[Inventory] Published LOW_STOCK for {item['id']}")
+    except Exception as e:
+        logging.error(f"[Inventory] Failed to publish low stock event: {e}")
+
 # ==========================================
 # 1. ADJUST INVENTORY (Manual Stock Opname)
 # ==========================================
@@ -125,40 +213,52 @@ def adjust_inventory(req: func.HttpRequest) -> func.HttpResponse:
         sku = req_body['sku']
         warehouse_code = req_body['warehouse_code']
         new_on_hand = int(req_body['quantity_on_hand'])
-        safety_stock = int(req_body.get('safety_stock', 0))
+        if new_on_hand < 0:
+            return func.HttpResponse("Error: quantity_on_hand must be >= 0", status_code=400)
         
         doc_id = f"{sku}_{warehouse_code}"
 
-        # 1. Ambil data lama
-        try:
-            existing_item = ctr.read_item(item=doc_id, partition_key=sku)
-            current_reserved = existing_item.get('quantity_reserved', 0)
-            old_on_hand = existing_item.get('quantity_on_hand', 0)
-            product_name = existing_item.get('product_name')
-        except exceptions.CosmosResourceNotFoundError:
-            current_reserved = 0
-            old_on_hand = 0
-            product_name = req_body.get('product_name', 'Unknown Product')
-
-        # Hitung Selisih untuk Ledger (Baru - Lama)
-        diff_qty = new_on_hand - old_on_hand
-
-        # 2. Hitung Available
-        available = new_on_hand - current_reserved
-
-        # 3. Simpan Inventory Item
-        inventory_item = {
-            "id": doc_id,
-            "sku": sku,
-            "warehouse_code": warehouse_code,
-            "quantity_on_hand": new_on_hand,
-            "quantity_reserved": current_reserved,
-            "quantity_available": available,
-            "safety_stock": safety_stock,
-            "product_name": product_name,
-            "last_updated": get_iso_timestamp()
-        }
-        ctr.upsert_item(body=inventory_item)
+        def build(rows):
+            # 1. Ambil data lama (dari partisi SKU; row yang di-replace dijaga etag)
+            existing_item = next((r for r in rows if r['id'] == doc_id), None)
+            if existing_item:
+                item = dict(existing_item)
+                old_on_hand = item.get('quantity_on_hand', 0)
+            else:
+                item = {
+                    "id": doc_id,
+                    "sku": sku,
+                    "warehouse_code": warehouse_code,
+                    "quantity_on_hand": 0,
+                    "quantity_reserved": 0,
+                    "product_name": req_body.get('product_name', 'Unknown Product'),
+                    "low_stock_alerted": False,
+                    "low_stock_seq": 0
+                }
+                old_on_hand = 0
+            tenant_id = item.get('tenantId') or req_body.get('tenantId')
+            if tenant_id:
+                item["tenantId"] = tenant_id
+
+            # safety_stock tidak dikirim -> pakai nilai lama
+            item["safety_stock"] = int(req_body.get('safety_stock', item.get('safety_stock', 0)))
+
+            # 2. Hitung Selisih untuk Ledger (Baru - Lama); quantity_reserved tidak disentuh
+            diff_qty = new_on_hand - old_on_hand
+            updated = apply_row_change(item, on_hand_delta=diff_qty)
+
+            # 3. Simpan Inventory Item: replace dengan etag / create (bentrok 409 kalau row dibuat proses lain)
+            if existing_item:
+                operation = replace_op(updated)
+            else:
+                operation = ("create", ({k: v for k, v in updated.items() if k != '_publish_low_stock'},))
+            return [operation], (updated, diff_qty)
+
+        inventory_item, diff_qty = run_sku_batch(ctr, sku, build, duplicate_on_conflict=False)
+        tenant_id = inventory_item.get('tenantId')
+        product_name = inventory_item.get('product_name')
+        if inventory_item.pop('_publish_low_stock'):
+            publish_low_stock_event(inventory_item)
         
         # 4. CATAT KE LEDGER (Jika ada perubahan)
         if diff_qty != 0:
@@ -166,19 +266,442 @@ def adjust_inventory(req: func.HttpRequest) -> func.HttpResponse:
                 sku=sku, 
                 warehouse_code=warehouse_code, 
                 change_qty=diff_qty, 
-                balance_after=new_on_hand, # Balance ledger biasanya mengacu ke On Hand (Fisik)
+                balance_after=inventory_item['quantity_on_hand'], # Balance ledger biasanya mengacu ke On Hand (Fisik)
                 reason="MANUAL_ADJUSTMENT",
-                ref_id="Opname-API"
+                ref_id="Opname-API",
+                tenant_id=tenant_id
             )
         
         # 5. Trigger Sync
         publish_stock_event(sku, product_name)
         
-        return func.HttpResponse(json.dumps(inventory_item), mimetype="application/json", status_code=200)
+        body = {k: v for k, v in inventory_item.items() if not k.startswith('_')}
+        return func.HttpResponse(json.dumps(body), mimetype="application/json", status_code=200)
 
     except Exception as e:
         return func.HttpResponse(f"Error: {str(e)}", status_code=500)
 
+# ==========================================
+# ALLOCATION ENGINE (Multi-Warehouse)
+# ==========================================
+class AllocationError(Exception):
+    pass
+
+# Status dokumen reservasi; selain ACTIVE = tombstone (sudah dilepas, menunggu TTL)
+RESERVATION_ACTIVE = "ACTIVE"
+RESERVATION_EXPIRED = "EXPIRED"
+SETTLED_STATUS = {"ORDER_CANCELLED": "CANCELLED", "ORDER_COMPLETED": "COMPLETED"}
+# Entry ledger yang menandakan order sudah di-settle (cancel / complete)
+SETTLED_LEDGER_REASONS = {"ORDER_CANCELLED_RESTORE", "ORDER_FULFILLED"}
+
+def load_sku_rows(ctr, sku, use_cache=True):
+    """Semua row gudang untuk 1 SKU (1 partisi). Cache pendek, kebenaran dijaga etag saat batch."""
+    now = time.time()
+    cached = availability_cache.get(sku)
+    if use_cache and cached and cached[0] > now:
+        return cached[1]
+
+    rows = list(ctr.query_items(query="SELECT * FROM c WHERE NOT IS_DEFINED(c.doc_type)", partition_key=sku))
+    availability_cache[sku] = (now + AVAILABILITY_CACHE_TTL_SEC, rows)
+    return rows
+
+def rank_warehouses(rows, region, strategy):
+    if strategy == "most_stock":
+        return sorted(rows, key=lambda r: -r.get('quantity_available', 0))
+    # nearest (dan split): urutan prioritas gudang per region, sisanya stok terbanyak
+    priority = WAREHOUSE_PRIORITY.get(region) or WAREHOUSE_PRIORITY.get("default") or []
+    rank = {code: i for i, code in enumerate(priority)}
+    return sorted(rows, key=lambda r: (rank.get(r['warehouse_code'], len(rank)), -r.get('quantity_available', 0)))
+
+def plan_allocation(rows, qty, preferred_wh=None, region=None, strategy=ALLOCATION_STRATEGY):
+    """Return [(row, qty)] atau None kalau stok tidak cukup."""
+    # Gudang dari event dipakai kalau ada dan stoknya cukup
+    for r in rows:
+        if r['warehouse_code'] == preferred_wh and r.get('quantity_available', 0) >= qty:
+            return [(r, qty)]
+
+    ranked = rank_warehouses(rows, region, strategy)
+    if strategy != "split":
+        for r in ranked:
+            if r.get('quantity_available', 0) >= qty:
+                return [(r, qty)]
+        return None
+
+    plan, remaining = [], qty
+    for r in ranked:
+        take = min(r.get('quantity_available', 0), remaining)
+        if take > 0:
+            plan.append((r, take))
+            remaining -= take
+        if remaining == 0:
+            return plan
+    return None
+
+def apply_row_change(row, reserved_delta=0, on_hand_delta=0):
+    row = dict(row)
+    row['quantity_on_hand'] = max(0, row.get('quantity_on_hand', 0) + on_hand_delta)
+    row['quantity_reserved'] = max(0, row.get('quantity_reserved', 0) + reserved_delta)
+    row['quantity_available'] = row['quantity_on_hand'] - row['quantity_reserved']
+    row['last_updated'] = get_iso_timestamp()
+    row['_publish_low_stock'] = evaluate_low_stock(row)
+    return row
+
+def replace_op(row):
+    body = {k: v for k, v in row.items() if k != '_publish_low_stock'}
+    return ("replace", (row['id'], body), {"if_match_etag": row['_etag']})
+
+def run_sku_batch(ctr, sku, build, before_commit=None, duplicate_on_conflict=True):
+    """
+    build(rows) -> (operations, lines). Semua operasi dieksekusi sebagai 1 transactional batch
+    di partisi /sku. Etag berubah (412) / reservasi sudah dilepas proses lain (404)
+    -> baca ulang & rencanakan ulang. Reservation sudah ada (409) -> event duplikat, return None
+    (duplicate_on_conflict=False: 409 = row dibuat proses lain -> baca ulang seperti 412).
+    """
+    for attempt in range(ALLOCATION_MAX_RETRIES):
+        use_cache = attempt == 0
+        rows = load_sku_rows(ctr, sku, use_cache=use_cache)
+        try:
+            operations, lines = build(rows)
+        except AllocationError:
+            if not use_cache:
+                raise
+            # Cache bisa basi (mis. baru restock) -> baca ulang tanpa cache sebelum menolak
+            rows = load_sku_rows(ctr, sku, use_cache=False)
+            operations, lines = build(rows)
+        if not operations:
+            return lines
+        if before_commit:
+            before_commit()
+        try:
+            ctr.execute_item_batch(batch_operations=operations, partition_key=sku)
+            availability_cache.pop(sku, None)
+            return lines
+        except exceptions.CosmosBatchOperationError as e:
+            availability_cache.pop(sku, None)
+            if e.status_code == 409 and duplicate_on_conflict:
+                return None
+            if e.status_code not in [404, 409, 412]:
+                raise
+    raise AllocationError("inventory changed concurrently, retries exhausted")
+
+def reserve_order(ctr, event):
+    sku = event['sku']
+    qty = int(event.get('quantity', 0))
+    order_id = event['order_id']
+    strategy = event.get('allocation_strategy') or ALLOCATION_STRATEGY
+    hold_min = float(event.get('hold_minutes') or RESERVATION_HOLD_MIN)
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=hold_min)
+    index_entries = []
+
+    def build(rows):
+        plan = plan_allocation(rows, qty, event.get('warehouse_code'), event.get('region'), strategy)
+        if plan is None:
+            raise AllocationError(f"insufficient stock for {qty} pcs ({strategy})")
+
+        operations, lines = [], []
+        index_entries.clear()
+        for i, (row, take) in enumerate(plan):
+            updated = apply_row_change(row, reserved_delta=take)
+            operations.append(replace_op(updated))
+            # Catatan reservasi per gudang, dipakai saat cancel/complete.
+            # id pakai index (bukan gudang) -> event duplikat selalu bentrok di res_{order}_0 walau alokasinya beda
+            operations.append(("create", ({
+                "id": f"res_{order_id}_{i}",
+                "doc_type": "reservation",
+                "sku": sku,
+                "warehouse_code": row['warehouse_code'],
+                "order_id": order_id,
+                "quantity": take,
+                "status": RESERVATION_ACTIVE,
+                "created_at": get_iso_timestamp(),
+                "expires_at": expires_at.isoformat(),
+                # TTL Cosmos hanya jaring pengaman (default TTL container = -1, lihat ensure_default_ttl);
+                # pelepasan stok tetap oleh sweeper, jadi TTL diberi grace period
+                "ttl": int(hold_min * 60) + RESERVATION_TTL_GRACE_SEC
+            },)))
+            index_entries.append((f"res_{order_id}_{i}", expires_at))
+            lines.append((updated, take))
+        return operations, lines
+
+    # Index ditulis SEBELUM batch: index tanpa reservasi aman (diabaikan sweeper),
+    # reservasi tanpa index tidak akan pernah expire
+    return run_sku_batch(ctr, sku, build, before_commit=lambda: write_expiry_index(sku, index_entries))
+
+def reservation_tombstone(res, status):
+    """
+    Reservasi tidak dihapus saat dilepas, tapi di-replace jadi tombstone (status != ACTIVE) dengan etag:
+    event redelivery / proses lain yang datang belakangan melihat reservasi sudah selesai.
+    Tombstone dibersihkan TTL setelah grace period.
+    """
+    body = {k: v for k, v in res.items() if not k.startswith('_')}
+    body.update({"status": status, "settled_at": get_iso_timestamp(), "ttl": RESERVATION_TTL_GRACE_SEC})
+    return ("replace", (res['id'], body), {"if_match_etag": res['_etag']})
+
+def legacy_holds(sku, order_id, event, completed):
+    """
+    Order tanpa dokumen reservasi sama sekali -> [(gudang, qty, None, release_reserved)] dari ledger.
+    - Sudah ORDER_CANCELLED_RESTORE / ORDER_FULFILLED -> [] (sudah di-settle).
+    - ORDER_RESERVED ada: pakai gudang & qty-nya; kalau sudah RESERVATION_EXPIRED, reserved tidak dilepas lagi.
+    - Tidak ada hold sama sekali: cancel tidak melakukan apa-apa, complete tetap memotong on_hand
+      di gudang event (reserved dilepas, di-clamp 0) supaya stok fisik tidak jadi phantom.
+    """
+    entries = list(get_container(CONTAINER_LEDGER).query_items(
+        query="SELECT c.reason, c.warehouse_code, c.change_amount FROM c WHERE c.reference_id = @order_id",
+        parameters=[{"name": "@order_id", "value": order_id}],
+        partition_key=sku
+    ))
+    reasons = {e.get('reason') for e in entries}
+    if reasons & SETTLED_LEDGER_REASONS:
+        logging.warning(f"[Inventory] Order {order_id}: already settled per ledger, nothing to apply")
+        return []
+    expired = "RESERVATION_EXPIRED" in reasons
+    if expired and not completed:
+        logging.warning(f"[Inventory] Order {order_id}: reservation already expired, nothing to release")
+        return []
+
+    reserved = {}
+    for e in entries:
+        if e.get('reason') == "ORDER_RESERVED":
+            wh = e.get('warehouse_code') or event.get('warehouse_code')
+            if not wh:
+                raise AllocationError(f"no reservation record for order {order_id} and no warehouse_code to settle")
+            reserved[wh] = reserved.get(wh, 0) + int(e.get('change_amount') or 0)
+    if reserved:
+        return [(wh, qty, None, not expired) for wh, qty in reserved.items() if qty > 0]
+
+    if not completed:
+        logging.warning(f"[Inventory] Order {order_id}: no reservation found for {sku}, nothing to release")
+        return []
+    if not event.get('warehouse_code'):
+        raise AllocationError(f"no reservation record for order {order_id} and event has no warehouse_code")
+    return [(event['warehouse_code'], int(event.get('quantity', 0)), None, True)]
+
+def settle_order(ctr, event):
+    """
+    ORDER_CANCELLED: lepas reservasi (reserved) sesuai alokasi saat ORDER_CREATED.
+    ORDER_COMPLETED: lepas reservasi + potong on_hand. Hold yang sudah EXPIRED tetap dipotong on_hand-nya
+    (barang tetap keluar), hanya reserved yang tidak dilepas dua kali.
+    Return None kalau tidak ada yang perlu diterapkan (event duplikat / order sudah selesai).
+    """
+    sku = event['sku']
+    order_id = event['order_id']
+    status = SETTLED_STATUS[event['action']]
+    completed = status == "COMPLETED"
+
+    def build(rows):
+        # Dibaca ulang tiap attempt: sweeper bisa saja baru melepas reservasi yang sama
+        reservations = list(ctr.query_items(
+            query="SELECT * FROM c WHERE c.doc_type = 'reservation' AND c.order_id = @order_id",
+            parameters=[{"name": "@order_id", "value": order_id}],
+            partition_key=sku
+        ))
+        if reservations:
+            statuses = {r.get('status', RESERVATION_ACTIVE) for r in reservations}
+            if statuses & set(SETTLED_STATUS.values()):
+                return [], None  # sudah di-cancel / complete sebelumnya
+            # (gudang, qty, dokumen, reserved masih ditahan?)
+            holds = [
+                (r['warehouse_code'], int(r['quantity']), r, r.get('status', RESERVATION_ACTIVE) == RESERVATION_ACTIVE)
+                for r in reservations
+                if completed or r.get('status', RESERVATION_ACTIVE) == RESERVATION_ACTIVE
+            ]
+            if not holds:
+                logging.warning(f"[Inventory] Order {order_id}: reservation already expired, nothing to release")
+                return [], None
+        else:
+            holds = legacy_holds(sku, order_id, event, completed)
+            if not holds:
+                return [], None
+
+        by_wh = {r['warehouse_code']: r for r in rows}
+        operations, lines, taken = [], [], {}
+        for wh, qty, res, release_reserved in holds:
+            if res is not None:
+                operations.append(reservation_tombstone(res, status))
+            if wh not in by_wh:
+                # Row gudang sudah dihapus: tidak ada stok yang dilepas, reservasinya tetap ditutup
+                logging.warning(f"[Inventory] Order {order_id}: inventory row {sku}/{wh} not found, closing reservation only")
+                continue
+            release, deduct = taken.get(wh, (0, 0))
+            taken[wh] = (release + (qty if release_reserved else 0), deduct + (qty if completed else 0))
+        for wh, (release, deduct) in taken.items():
+            updated = apply_row_change(by_wh[wh], reserved_delta=-release, on_hand_delta=-deduct)
+            operations.append(replace_op(updated))
+            lines.append((updated, deduct if completed else release))
+        if not reservations:
+            # Tombstone juga untuk order lama -> redelivery bentrok (409) dan di-skip
+            for i, (wh, qty, _, _) in enumerate(holds):
+                operations.append(("create", ({
+                    "id": f"res_{order_id}_{i}", "doc_type": "reservation", "sku": sku, "order_id": order_id,
+                    "warehouse_code": wh, "quantity": qty, "status": status,
+                    "created_at": get_iso_timestamp(), "settled_at": get_iso_timestamp(), "ttl": RESERVATION_TTL_GRACE_SEC
+                },)))
+        return operations, lines
+
+    return run_sku_batch(ctr, sku, build)
+
+# ==========================================
+# RESERVATION EXPIRY (Time-Bucketed Index + Sweeper)
+# ==========================================
+SWEEP_CHECKPOINT_ID = "sweep_checkpoint"
+SWEEP_CHECKPOINT_BUCKET = "__checkpoint__"
+SWEEP_DEADLETTER_BUCKET = "__deadletter__"
+BUCKET_FORMAT = "%Y-%m-%dT%H:%M"
+
+def bucket_start(ts):
+    """
+    Floor ke kelipatan RESERVATION_BUCKET_MIN menit sejak epoch (bukan menit dalam jam),
+    jadi bucket + step selalu jatuh di bucket berikutnya walau 60 tidak habis dibagi N.
+    """
+    epoch_min = int(ts.timestamp() // 60)
+    return datetime.datetime.fromtimestamp((epoch_min - epoch_min % RESERVATION_BUCKET_MIN) * 60, tz=datetime.timezone.utc)
+
+def expiry_bucket(ts):
+    """'YYYY-MM-DDTHH:MM' awal bucket (dipakai sebagai partition key index)."""
+    return bucket_start(ts).strftime(BUCKET_FORMAT)
+
+def parse_bucket(key):
+    return datetime.datetime.strptime(key, BUCKET_FORMAT).replace(tzinfo=datetime.timezone.utc)
+
+def write_expiry_index(sku, entries):
+    idx = get_container(CONTAINER_EXPIRY_INDEX, pk_path="/bucket")
+    for res_id, expires_at in entries:
+        idx.upsert_item(body={
+            "id": f"{sku}|{res_id}",
+            "bucket": expiry_bucket(expires_at),
+            "sku": sku,
+            "reservation_id": res_id,
+            "expires_at": expires_at.isoformat()
+        })
+
+def release_expired(ctr, sku, reservation_ids, now_iso):
+    """Lepas reservasi expired untuk 1 SKU, per chunk SWEEP_BATCH_SIZE (1 transactional batch per chunk)."""
+    released = 0
+    for i in range(0, len(reservation_ids), SWEEP_BATCH_SIZE):
+        chunk = reservation_ids[i:i + SWEEP_BATCH_SIZE]
+
+        def build(rows):
+            due = list(ctr.query_items(
+                query="""
+                    SELECT * FROM c WHERE c.doc_type = 'reservation' AND ARRAY_CONTAINS(@ids, c.id)
+                    AND c.expires_at <= @now AND (c.status ?? @active) = @active
+                """,
+                parameters=[{"name": "@ids", "value": chunk}, {"name": "@now", "value": now_iso}, {"name": "@active", "value": RESERVATION_ACTIVE}],
+                partition_key=sku
+            ))
+            # Beberapa reservasi di gudang yang sama -> 1 replace per row
+            release = {}
+            for r in due:
+                release[r['warehouse_code']] = release.get(r['warehouse_code'], 0) + int(r['quantity'])
+
+            by_wh = {r['warehouse_code']: r for r in rows}
+            operations, updated = [], {}
+            for wh, qty in release.items():
+                if wh in by_wh:
+                    updated[wh] = apply_row_change(by_wh[wh], reserved_delta=-qty)
+                    operations.append(replace_op(updated[wh]))
+            # Tombstone (bukan delete) -> cancel/complete yang datang belakangan tahu hold-nya sudah expired
+            operations += [reservation_tombstone(r, RESERVATION_EXPIRED) for r in due]
+            return operations, [(updated.get(r['warehouse_code']), r) for r in due]
+
+        lines = run_sku_batch(ctr, sku, build) or []
+        for row, res in lines:
+            create_ledger_entry(
+                sku=sku,
+                warehouse_code=res['warehouse_code'],
+                change_qty=int(res['quantity']),
+                balance_after=row['quantity_on_hand'] if row else 0,
+                reason="RESERVATION_EXPIRED",
+                ref_id=res['order_id'],
+                tenant_id=row.get('tenantId') if row else None
+            )
+        released += len(lines)
+    if released:
+        publish_stock_event(sku, None)
+    return released
+
+def dead_letter(idx, doc_id, source_bucket, error, **fields):
+    """Simpan item yang gagal diproses sweeper ke partisi __deadletter__ (untuk diperiksa / replay manual)."""
+    idx.upsert_item(body={
+        "id": doc_id,
+        "bucket": SWEEP_DEADLETTER_BUCKET,
+        "source_bucket": source_bucket,
+        "error": str(error)[:1000],
+        "failed_at": get_iso_timestamp(),
+        **fields
+    })
+
+def _release_or_dead_letter(ctr, idx, bucket, sku, reservation_ids, now_iso):
+    try:
+        return release_expired(ctr, sku, reservation_ids, now_iso)
+    except Exception as e:
+        # Satu SKU bermasalah tidak boleh menahan checkpoint seluruh bucket
+        logging.error(f"[Sweeper] Bucket {bucket} SKU {sku} failed, dead-lettered {reservation_ids}: {e}")
+        for res_id in reservation_ids:
+            dead_letter(idx, f"{sku}|{res_id}", bucket, e, sku=sku, reservation_id=res_id)
+        return 0
+
+def sweep_bucket(ctr, idx, bucket, now_iso):
+    entries = list(idx.query_items(query="SELECT * FROM c", partition_key=bucket))
+    by_sku = {}
+    for e in entries:
+        by_sku.setdefault(e['sku'], []).append(e['reservation_id'])
+
+    released = 0
+    if by_sku:
+        with ThreadPoolExecutor(max_workers=min(SWEEP_MAX_WORKERS, len(by_sku))) as pool:
+            released = sum(pool.map(lambda kv: _release_or_dead_letter(ctr, idx, bucket, kv[0], kv[1], now_iso), by_sku.items()))
+
+    # Bersihkan index bucket ini (1 partisi -> transactional batch, maks 100 operasi)
+    for i in range(0, len(entries), 100):
+        idx.execute_item_batch(batch_operations=[("delete", (e['id'],)) for e in entries[i:i + 100]], partition_key=bucket)
+    return released
+
+@app.schedule(schedule="0 */1 * * * *", arg_name="timer", run_on_startup=False, use_monitor=True)
+def sweep_expired_reservations(timer: func.TimerRequest) -> None:
+    started = time.time()
+    ctr = get_container(CONTAINER_INVENTORY)
+    idx = get_container(CONTAINER_EXPIRY_INDEX, pk_path="/bucket")
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    step = datetime.timedelta(minutes=RESERVATION_BUCKET_MIN)
+    # Hanya bucket yang seluruhnya sudah lewat
+    last_due = bucket_start(now - step)
+
+    try:
+        checkpoint = idx.read_item(item=SWEEP_CHECKPOINT_ID, partition_key=SWEEP_CHECKPOINT_BUCKET)
+    except exceptions.CosmosResourceNotFoundError:
+        checkpoint = {"id": SWEEP_CHECKPOINT_ID, "bucket": SWEEP_CHECKPOINT_BUCKET}
+    if checkpoint.get('last_bucket'):
+        # Floor ulang: tetap sejajar walau RESERVATION_BUCKET_MIN diganti antar deploy
+        bucket = bucket_start(parse_bucket(checkpoint['last_bucket']) + step)
+    else:
+        bucket = last_due - step * (SWEEP_MAX_BUCKETS - 1)
+
+    swept, released = 0, 0
+    while bucket <= last_due and swept < SWEEP_MAX_BUCKETS and time.time() - started < SWEEP_TIME_BUDGET_SEC:
+        key = bucket.strftime(BUCKET_FORMAT)
+        try:
+            released += sweep_bucket(ctr, idx, key, now.isoformat())
+        except Exception as e:
+            # Gagal di level bucket (query/cleanup index): ulang di run berikutnya (idempotent),
+            # setelah SWEEP_MAX_BUCKET_ATTEMPTS kali bucket di-dead-letter supaya checkpoint tetap maju
+            attempts = checkpoint.get('failed_attempts', 0) + 1 if checkpoint.get('failed_bucket') == key else 1
+            if attempts < SWEEP_MAX_BUCKET_ATTEMPTS:
+                logging.error(f"[Sweeper] Bucket {key} failed (attempt {attempts}/{SWEEP_MAX_BUCKET_ATTEMPTS}): {e}")
+                checkpoint = {**checkpoint, "failed_bucket": key, "failed_attempts": attempts}
+                idx.upsert_item(body={k: v for k, v in checkpoint.items() if not k.startswith('_')})
+                break
+            logging.error(f"[Sweeper] Bucket {key} failed {attempts}x, dead-lettered: {e}")
+            dead_letter(idx, f"bucket|{key}", key, e)
+        checkpoint = {"id": SWEEP_CHECKPOINT_ID, "bucket": SWEEP_CHECKPOINT_BUCKET, "last_bucket": key}
+        idx.upsert_item(body=checkpoint)
+        swept += 1
+        bucket += step
+
+    if swept:
+        logging.info(f"[Sweeper] {swept} buckets, {released} reservations released")
+
 # ==========================================
 # 2. LISTEN TO ORDER EVENTS (Checkout/Cancel)
 # ==========================================
@@ -197,75 +720,57 @@ def process_marketplace_orders(msg: func.ServiceBusMessage):
     qty = int(event.get('quantity', 0))
     product_name = event.get('product_name', '')
     price = event.get('price', {})
-    wh_id = event.get('warehouse_code')
     order_id = event.get('order_id')
 
     logging.info(f"[Inventory] Processing Order {order_id}: {action} ({qty} pcs)")
+    if action in ["ORDER_CREATED", "ORDER_CANCELLED", "ORDER_COMPLETED"] and not (order_id and sku):
+        # Tanpa order_id, id reservasi jadi res_None_0 dan idempotensi per order tidak berlaku
+        logging.error(f"[Inventory] Rejecting {action} event without order_id/sku: {message_body[:200]}")
+        return
     
     ctr = get_container(CONTAINER_INVENTORY)
-    doc_id = f"{sku}_{wh_id}"
 
     try:
-        item = ctr.read_item(item=doc_id, partition_key=sku)
-        
-        current_on_hand = item.get('quantity_on_hand', 0)
-        current_reserved = item.get('quantity_reserved', 0)
-        
-        ledger_change = 0
-        ledger_reason = action
-        ledger_balance_ref = current_on_hand # Defaultnya kita track On Hand
-
         if action == "ORDER_CREATED":
-            # Booking: On Hand tetap, Reserved nambah
-            item['quantity_reserved'] = current_reserved + qty
-            
-            # Di Ledger, kita bisa catat "Booking" atau "Pending Sales"
-            # Tapi fisik belum berubah, jadi change_qty = 0 atau kita anggap ini hold
-            # Untuk simplicity, kita catat RESERVATION di ledger
-            ledger_change = 0 
+            # Booking: On Hand tetap, Reserved nambah (bisa di beberapa gudang)
+            lines = reserve_order(ctr, event)
             ledger_reason = "ORDER_RESERVED"
+        elif action in ["ORDER_CANCELLED", "ORDER_COMPLETED"]:
+            lines = settle_order(ctr, event)
+            ledger_reason = "ORDER_CANCELLED_RESTORE" if action == "ORDER_CANCELLED" else "ORDER_FULFILLED"
+        else:
+            return
+
+        if lines is None:
+            logging.warning(f"[Inventory] Order {order_id} ({action}) already applied or nothing to release, skipping")
+            return
+        if not lines:
+            return
 
-        elif action == "ORDER_CANCELLED":
-            # Batal: Reserved berkurang
-            item['quantity_reserved'] = max(0, current_reserved - qty)
-            ledger_change = 0
-            ledger_reason = "ORDER_CANCELLED_RESTORE"
-
-        elif action == "ORDER_COMPLETED":
-            # Shipped: Fisik Keluar
-            new_on_hand = max(0, current_on_hand - qty)
-            item['quantity_on_hand'] = new_on_hand
-            item['quantity_reserved'] = max(0, current_reserved - qty)
-            
-            # Ini yang masuk buku besar sebagai pengeluaran barang
-            ledger_change = -qty 
-            ledger_balance_ref = new_on_hand
-            ledger_reason = "ORDER_FULFILLED"
-
-        # Hitung Available & Simpan
-        item['quantity_available'] = item['quantity_on_hand'] - item['quantity_reserved']
-        item['last_updated'] = get_iso_timestamp()
-        
-        ctr.replace_item(item=doc_id, body=item)
-        
         # --- CATAT KE LEDGER ---
         # Kita catat setiap event order agar history lengkap
         # Walaupun change=0 (saat reserved), tetap dicatat agar tahu ada order masuk
-        create_ledger_entry(
-            sku=sku,
-            warehouse_code=wh_id,
-            change_qty=ledger_change if action == "ORDER_COMPLETED" else qty, # Saat reserve, kita catat qty ordernya sebagai info
-            balance_after=ledger_balance_ref,
-            product_name=product_name,
-            price=price,
-            reason=ledger_reason,
-            ref_id=order_id
-        )
+        for row, take in lines:
+            create_ledger_entry(
+                sku=sku,
+                warehouse_code=row['warehouse_code'],
+                change_qty=-take if action == "ORDER_COMPLETED" else take, # Saat reserve, kita catat qty ordernya sebagai info
+                balance_after=row['quantity_on_hand'],
+                product_name=product_name,
+                price=price,
+                reason=ledger_reason,
+                ref_id=order_id,
+                tenant_id=row.get('tenantId')
+            )
+            if row.get('_publish_low_stock'):
+                publish_low_stock_event(row)
 
-        publish_stock_event(sku, item.get('product_name'))
+        publish_stock_event(sku, lines[0][0].get('product_name') if lines else product_name)
 
+    except AllocationError as e:
+        logging.error(f"Cannot allocate order {order_id} for {sku}: {e}")
     except exceptions.CosmosResourceNotFoundError:
-        logging.error(f"Inventory not found for {sku} in {wh_id}")
+        logging.error(f"Inventory not found for {sku} in {event.get('warehouse_code')}")
     except Exception as e:
         logging.error(f"Failed to process order {order_id}: {e}")
 
@@ -281,6 +786,7 @@ def process_product_events_inventory(msg: func.ServiceBusMessage):
     if event.get('action') == "PRODUCT_CREATED":
         sku = event.get('sku')
         warehouses = event.get('data', {}).get('warehouses', [])
+        tenant_id = event.get('data', {}).get('tenantId')
         ctr = get_container(CONTAINER_INVENTORY)
         
         for wh in warehouses:
@@ -294,10 +800,13 @@ def process_product_events_inventory(msg: func.ServiceBusMessage):
                     "quantity_on_hand": qty, "quantity_reserved": 0, "quantity_available": qty,
                     "product_name": event.get('data', {}).get('name'), "last_updated": get_iso_timestamp()
                 }
+                if tenant_id:
+                    init_item["tenantId"] = tenant_id
                 ctr.upsert_item(body=init_item)
+                availability_cache.pop(sku, None)
                 
                 # Catat Initial Stock ke Ledger
-                create_ledger_entry(sku, wh_code, qty, qty, "INITIAL_STOCK", "Product-Create-Event")
+                create_ledger_entry(sku, wh_code, qty, qty, "INITIAL_STOCK", ref_id="Product-Create-Event", tenant_id=tenant_id)
                 
                 logging.info(f"Created Inventory {doc_id}")
             except: pass
@@ -319,7 +828,7 @@ def get_order_list(req: func.HttpRequest) -> func.HttpResponse:
         # Urutkan DESC (Terbaru di atas)
         query = """
             SELECT * FROM c 
-            WHERE c.reason IN ('ORDER_RESERVED', 'ORDER_FULFILLED', 'ORDER_CANCELLED_RESTORE')
+            WHERE c.reason IN ('ORDER_RESERVED', 'ORDER_FULFILLED', 'ORDER_CANCELLED_RESTORE', 'RESERVATION_EXPIRED')
             ORDER BY c.timestamp DESC 
             OFFSET 0 LIMIT @limit
         """
@@ -347,6 +856,8 @@ def get_order_list(req: func.HttpRequest) -> func.HttpResponse:
                     status_display = "COMPLETED"
                 elif raw_reason == "ORDER_CANCELLED_RESTORE":
                     status_display = "CANCELLED"
+                elif raw_reason == "RESERVATION_EXPIRED":
+                    status_display = "EXPIRED"
                 
                 unique_orders[order_id] = {
                     "order_id": order_id,
@@ -368,6 +879,65 @@ def get_order_list(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as e:
         return func.HttpResponse(f"Error: {str(e)}", status_code=500)
 
+# ==========================================
+# 5. REORDER SUGGESTION (Sales Velocity dari Ledger)
+# ==========================================
+@app.route(route="inventory/reorder", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def get_reorder_suggestions(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        days = max(1, int(req.params.get('days', REORDER_VELOCITY_DAYS)))
+        lead_time = int(req.params.get('lead_time_days', REORDER_LEAD_TIME_DAYS))
+        cover = int(req.params.get('cover_days', REORDER_COVER_DAYS))
+    except ValueError:
+        return func.HttpResponse("days, lead_time_days and cover_days must be integers", status_code=400)
+
+    try:
+        since = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)).isoformat()
+
+        # 1. Penjualan per (sku, gudang) dalam window -> hanya ORDER_FULFILLED terbaru, bukan full scan ledger
+        sold = {}
+        ledger = get_container(CONTAINER_LEDGER).query_items(
+            query="SELECT c.sku, c.warehouse_code, c.change_amount FROM c WHERE c.reason = 'ORDER_FULFILLED' AND c.timestamp >= @since",
+            parameters=[{"name": "@since", "value": since}],
+            enable_cross_partition_query=True
+        )
+        for e in ledger:
+            key = f"{e['sku']}_{e.get('warehouse_code')}"
+            sold[key] = sold.get(key, 0) + abs(e.get('change_amount', 0))
+
+        # 2. Bandingkan dengan stok sekarang (projection saja)
+        items = get_container(CONTAINER_INVENTORY).query_items(
+            query="SELECT c.id, c.sku, c.warehouse_code, c.product_name, c.quantity_available, c.safety_stock FROM c WHERE NOT IS_DEFINED(c.doc_type)",
+            enable_cross_partition_query=True
+        )
+
+        suggestions = []
+        for item in items:
+            velocity = sold.get(item['id'], 0) / days
+            available = item.get('quantity_available', 0)
+            safety_stock = item.get('safety_stock', 0)
+            reorder_point = velocity * lead_time + safety_stock
+
+            if available <= reorder_point:
+                suggestions.append({
+                    "sku": item['sku'],
+                    "warehouse_code": item['warehouse_code'],
+                    "product_name": item.get('product_name'),
+                    "quantity_available": available,
+                    "safety_stock": safety_stock,
+                    "daily_velocity": round(velocity, 2),
+                    "reorder_point": math.ceil(reorder_point),
+                    "days_of_cover": round(available / velocity, 1) if velocity else None,
+                    "suggested_qty": max(0, math.ceil(velocity * (lead_time + cover) + safety_stock - available))
+                })
+
+        # Paling mendesak dulu (cover paling sedikit); tanpa penjualan (days_of_cover None) di akhir
+        suggestions.sort(key=lambda s: (s['days_of_cover'] is None, s['days_of_cover'] or 0, s['quantity_available'] - s['safety_stock']))
+        return func.HttpResponse(json.dumps(suggestions), mimetype="application/json", status_code=200)
+
+    except Exception as e:
+        return func.HttpResponse(f"Error: {str(e)}", status_code=500)
+
 # import azure.functions as func
 # from azure.cosmos import CosmosClient, exceptions
 # from azure.servicebus import ServiceBusClient, ServiceBusMessage
@@ -0,0 +1,18 @@
+import azure.functions as func
+import json
+from mock_marketplace import handle
+
+app = func.FunctionApp()
+
+# Semua endpoint mock lewat satu route, dispatch ada di mock_marketplace.handle
+# MOCK_API_URL di SyncService -> https://<app>.azurewebsites.net/api
+@app.route(route="mock/{*path}", methods=["GET", "POST"], auth_level=func.AuthLevel.ANONYMOUS)
+def mock_marketplace(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        body = req.get_json()
+    except ValueError:
+        body = {}
+
+    shop_id = req.headers.get("X-Shop-Id") or req.params.get("shop_id")
+    status, resp, headers = handle(req.method, f"/mock/{req.route_params.get('path', '')}", body, shop_id)
+    return func.HttpResponse(json.dumps(resp), status_code=status, headers=headers, mimetype="application/json")
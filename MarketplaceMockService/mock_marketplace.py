@@ -0,0 +1,295 @@
+# mock_marketplace.py
+# Mock Tokopedia / Shopee / Lazada untuk load test SyncService tanpa akses internet.
+# - Latency bisa diatur (fixed / uniform / lognormal)
+# - Injeksi error 429 & 5xx (probabilitas)
+# - Rate limit per shop (token bucket), balas 429 + Retry-After
+# - Listing disimpan in-memory, di-seed dari products_db_shopee.json (ikut di-deploy bersama mock ini)
+#
+# Jalankan standalone (hanya stdlib):
+#   python mock_marketplace.py --port 7075
+#   -> set MOCK_API_URL=http://localhost:7075 di SyncService
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+SEED_FILE = os.environ.get(
+    "MOCK_SEED_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'products_db_shopee.json')
+)
+
+# ==========================================
+# 1. KONFIGURASI (Environment)
+# ==========================================
+# MOCK_LATENCY: "fixed:50" | "uniform:20:200" | "lognormal:80:0.6" (median ms, sigma)
+LATENCY_SPEC = os.environ.get("MOCK_LATENCY", "fixed:0")
+RATE_429 = float(os.environ.get("MOCK_429_RATE", "0"))
+RATE_5XX = float(os.environ.get("MOCK_5XX_RATE", "0"))
+SHOP_RATE_LIMIT = float(os.environ.get("MOCK_SHOP_RATE_LIMIT", "0"))  # request/detik per shop, 0 = tanpa limit
+SHOP_BURST = float(os.environ.get("MOCK_SHOP_BURST", "0")) or None
+RNG = random.Random(os.environ.get("MOCK_RANDOM_SEED"))
+
+def sample_latency(spec=None):
+    """Sampel latency (detik) dari spesifikasi MOCK_LATENCY."""
+    kind, *args = (spec or LATENCY_SPEC).split(":")
+    args = [float(a) for a in args]
+    if kind == "fixed":
+        ms = args[0] if args else 0
+    elif kind == "uniform":
+        ms = RNG.uniform(args[0], args[1])
+    elif kind == "lognormal":
+        ms = args[0] * RNG.lognormvariate(0, args[1] if len(args) > 1 else 0.5)
+    else:
+        raise ValueError(f"Unknown latency spec: {spec}")
+    return max(0.0, ms) / 1000.0
+
+class ShopBucket:
+    """Token bucket non-blocking per (marketplace, shop)."""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self):
+        """Return 0 kalau boleh, atau detik yang harus ditunggu (Retry-After)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+# ==========================================
+# 2. LISTING STORE (In-Memory)
+# ==========================================
+class ListingStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(100000)
+        self.listings = {"TOKOPEDIA": {}, "SHOPEE": {}, "LAZADA": {}}  # marketplace -> {id: listing}
+        self.by_sku = {"TOKOPEDIA": {}, "SHOPEE": {}, "LAZADA": {}}    # marketplace -> {sku: id}
+        self.buckets = {}
+        self.stats = {"requests": 0, "throttled": 0, "injected_429": 0, "injected_5xx": 0, "stock_items_updated": 0}
+
+    def seed(self, path=SEED_FILE):
+        if not os.path.exists(path): return
+        with open(path, "r") as f:
+            items = json.load(f)
+        for item in items:
+            raw_id = str(item.get('id', ''))
+            item_id = int(raw_id) if raw_id.isdigit() else next(self.ids)
+            sku = item.get('item_sku') or raw_id
+            self.listings["SHOPEE"][item_id] = {
+                "item_id": item_id,
+                "item_sku": sku,
+                "item_name": item.get('item_name'),
+                "original_price": item.get('price_info', {}).get('original_price', 0),
+                "seller_stock": item.get('seller_stock', []),
+                "image": {"image_url_list": item.get('images', {}).get('image_url_list', [])}
+            }
+            self.by_sku["SHOPEE"][sku] = item_id
+
+    def upsert(self, marketplace, sku, listing):
+        """Create kalau SKU belum ada, kalau sudah ada update listing yang sama (idempotent)."""
+        with self.lock:
+            listing_id = self.by_sku[marketplace].get(sku)
+            if listing_id is None:
+                listing_id = next(self.ids)
+                self.by_sku[marketplace][sku] = listing_id
+            self.listings[marketplace][listing_id] = {**listing, "id": listing_id}
+            return listing_id
+
+    def incr(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def throttle(self, marketplace, shop_id):
+        if SHOP_RATE_LIMIT <= 0: return 0
+        with self.lock:
+            bucket = self.buckets.get((marketplace, shop_id))
+            if bucket is None:
+                bucket = self.buckets[(marketplace, shop_id)] = ShopBucket(SHOP_RATE_LIMIT, SHOP_BURST)
+            return bucket.try_acquire()
+
+store = ListingStore()
+store.seed()
+
+def total_stock(listing):
+    return sum(int(s.get('stock', 0)) for s in listing.get('seller_stock', []))
+
+# ==========================================
+# 3. HANDLERS PER MARKETPLACE
+# ==========================================
+def tokopedia_create(body, m):
+    sku = (body.get('skus') or [{}])[0].get('seller_sku')
+    product_id = store.upsert("TOKOPEDIA", sku, body)
+    return 200, {"code": 0, "data": {"product_id": product_id}}
+
+def tokopedia_get(body, m):
+    listing = store.listings["TOKOPEDIA"].get(int(m.group(1)))
+    if not listing: return 404, {"code": 404, "message": "product not found"}
+    return 200, {"code": 0, "data": listing}
+
+def tokopedia_inventory_update(body, m):
+    listing = store.listings["TOKOPEDIA"].get(int(m.group(1)))
+    if not listing: return 404, {"code": 404, "message": "product not found"}
+    with store.lock:
+        for key in ("title", "status", "main_images"):
+            if key in body: listing[key] = body[key]
+        inv = (body.get('skus') or [{}])[0].get('inventory')
+        if inv is not None:
+            listing.setdefault('skus', [{}])[0]['inventory'] = inv
+            store.stats["stock_items_updated"] += 1
+    return 200, {"code": 0, "data": {"product_id": listing['id']}}
+
+def shopee_add_item(body, m):
+    item_id = store.upsert("SHOPEE", body.get('item_sku'), body)
+    store.listings["SHOPEE"][item_id]['item_id'] = item_id
+    return 200, {"error": "", "response": {"item_id": item_id}}
+
+def shopee_update_stock(body, m):
+    success, failure = [], []
+    with store.lock:
+        for entry in body.get('item_list', []):
+            listing = store.listings["SHOPEE"].get(entry.get('item_id'))
+            if not listing:
+                failure.append({"item_id": entry.get('item_id'), "failed_reason": "item_not_found"})
+                continue
+            stock = sum(int(s.get('stock', 0)) for sl in entry.get('stock_list', []) for s in sl.get('seller_stock', []))
+            listing['seller_stock'] = [{"location_id": "DEFAULT", "stock": stock}]
+            success.append({"item_id": entry.get('item_id')})
+            store.stats["stock_items_updated"] += 1
+    return 200, {"error": "", "response": {"success_list": success, "failure_list": failure}}
+
+def shopee_get_item_base_info(body, m):
+    items = []
+    for item_id in body.get('item_id_list', []):
+        listing = store.listings["SHOPEE"].get(int(item_id))
+        if listing:
+            items.append({
+                "item_id": listing['item_id'], "item_sku": listing.get('item_sku'), "item_name": listing.get('item_name'),
+                "stock_info_v2": {"summary_info": {"total_available_stock": total_stock(listing)}}
+            })
+    return 200, {"error": "", "response": {"item_list": items}}
+
+def lazada_create(body, m):
+    sku = (body.get('payload', {}).get('Skus') or [{}])[0].get('SellerSku')
+    item_id = store.upsert("LAZADA", sku, body.get('payload', {}))
+    return 200, {"code": "0", "data": {"item_id": item_id}}
+
+def lazada_price_quantity_update(body, m):
+    detail = []
+    with store.lock:
+        for s in body.get('payload', {}).get('Skus', []):
+            listing_id = store.by_sku["LAZADA"].get(s.get('SellerSku'))
+            if listing_id is None:
+                detail.append({"seller_sku": s.get('SellerSku'), "message": "SKU_NOT_FOUND"})
+                continue
+            sku_row = store.listings["LAZADA"][listing_id].setdefault('Skus', [{}])[0]
+            if 'Quantity' in s: sku_row['quantity'] = s['Quantity']
+            if 'Price' in s: sku_row['price'] = s['Price']
+            store.stats["stock_items_updated"] += 1
+    return 200, {"code": "0", "detail": detail}
+
+def lazada_products_get(body, m):
+    products = []
+    for sku in body.get('sku_seller_list', []):
+        listing_id = store.by_sku["LAZADA"].get(sku)
+        if listing_id is None: continue
+        listing = store.listings["LAZADA"][listing_id]
+        products.append({"item_id": listing_id, "skus": listing.get('Skus', [])})
+    return 200, {"code": "0", "data": {"products": products}}
+
+def mock_stats(body, m):
+    with store.lock:
+        return 200, dict(store.stats)
+
+# (method, regex path, marketplace, handler)
+ROUTES = [
+    ("POST", r"/mock/tokopedia/product/202309/products", "TOKOPEDIA", tokopedia_create),
+    ("GET",  r"/mock/tokopedia/product/202309/products/(\d+)", "TOKOPEDIA", tokopedia_get),
+    ("POST", r"/mock/tokopedia/product/202309/products/(\d+)/inventory/update", "TOKOPEDIA", tokopedia_inventory_update),
+    ("POST", r"/mock/shopee/api/v2/product/add_item", "SHOPEE", shopee_add_item),
+    ("POST", r"/mock/shopee/api/v2/product/update_stock", "SHOPEE", shopee_update_stock),
+    ("POST", r"/mock/shopee/api/v2/product/get_item_base_info", "SHOPEE", shopee_get_item_base_info),
+    ("POST", r"/mock/lazada/product/create", "LAZADA", lazada_create),
+    ("POST", r"/mock/lazada/product/price_quantity/update", "LAZADA", lazada_price_quantity_update),
+    ("POST", r"/mock/lazada/products/get", "LAZADA", lazada_products_get),
+    ("GET",  r"/mock/_stats", None, mock_stats),
+]
+ROUTES = [(method, re.compile(pattern + "$"), mp, fn) for method, pattern, mp, fn in ROUTES]
+
+def handle(method, path, body=None, shop_id=None):
+    """
+    Entry point tunggal (dipakai HTTP server standalone & Function App).
+    Return (status_code, response_dict, extra_headers).
+    """
+    store.incr("requests")
+    for route_method, pattern, marketplace, fn in ROUTES:
+        m = pattern.match(path)
+        if not m or route_method != method: continue
+
+        time.sleep(sample_latency())
+        if marketplace:
+            wait = store.throttle(marketplace, shop_id or "default")
+            if wait:
+                store.incr("throttled")
+                return 429, {"error": "rate_limited"}, {"Retry-After": str(max(1, round(wait)))}
+            roll = RNG.random()
+            if roll < RATE_429:
+                store.incr("injected_429")
+                return 429, {"error": "too_many_requests"}, {"Retry-After": "1"}
+            if roll < RATE_429 + RATE_5XX:
+                store.incr("injected_5xx")
+                return RNG.choice([500, 502, 503]), {"error": "internal_error"}, {}
+
+        status, resp = fn(body or {}, m)
+        return status, resp, {}
+    return 404, {"error": "route_not_found", "path": path}, {}
+
+# ==========================================
+# 4. STANDALONE HTTP SERVER
+# ==========================================
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length)) if length else {}
+        except ValueError:
+            body = {}
+        shop_id = self.headers.get('X-Shop-Id') or parse_qs(url.query).get('shop_id', [None])[0]
+
+        status, resp, headers = handle(method, url.path, body, shop_id)
+        raw = json.dumps(resp).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self): self._dispatch("GET")
+    def do_POST(self): self._dispatch("POST")
+    def log_message(self, format, *args): pass  # jangan spam log saat load test
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Mock marketplace server (Tokopedia/Shopee/Lazada)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7075)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    print(f"Mock marketplace listening on http://{args.host}:{args.port} (seeded {len(store.listings['SHOPEE'])} Shopee listings)")
+    server.serve_forever()
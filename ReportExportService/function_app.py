@@ -0,0 +1,106 @@
+# Streaming export laporan inventory (CSV / NDJSON).
+# Dipisah dari ReportService: route di sini memakai tipe HTTP streams
+# (azurefunctions.extensions.http.fastapi), yang tidak boleh dicampur dengan
+# route func.HttpRequest dalam satu function app.
+import azure.functions as func
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+import zlib
+from azurefunctions.extensions.http.fastapi import Request, Response, StreamingResponse
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.auth import require_user, error
+from utils.inventory_store import iter_inventory_pages, load_product_prices, load_movements, MOVEMENT_FIELDS
+
+app = func.FunctionApp()
+
+EXPORT_PAGE_SIZE = int(os.environ.get("REPORT_EXPORT_PAGE_SIZE", "500"))
+
+EXPORT_FIELDS = [
+    "sku", "warehouse_code", "product_name", "unit_price",
+    "quantity_on_hand", "quantity_reserved", "quantity_available", "stock_value",
+    "received", "adjusted", "reserved", "cancelled", "fulfilled", "revenue", "last_updated"
+]
+EXPORT_CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+def parse_date_range(params):
+    """?from=YYYY-MM-DD&to=YYYY-MM-DD (inklusif) -> (from_iso, to_iso_exclusive)."""
+    date_from = params.get("from")
+    date_to = params.get("to")
+    start = datetime.date.fromisoformat(date_from).isoformat() if date_from else None
+    end = (datetime.date.fromisoformat(date_to) + datetime.timedelta(days=1)).isoformat() if date_to else None
+    return start, end
+
+def iter_export_pages(tenant_id, start, end):
+    """Yield list row per halaman Cosmos -> memori dibatasi EXPORT_PAGE_SIZE, bukan ukuran tenant."""
+    fields = ["sku", "warehouse_code", "product_name", "quantity_on_hand", "quantity_reserved", "quantity_available", "last_updated"]
+    for items in iter_inventory_pages(tenant_id, fields=fields, page_size=EXPORT_PAGE_SIZE):
+        skus = list({i["sku"] for i in items})
+        prices = load_product_prices(skus)
+        movements = load_movements(skus, start, end, page_size=EXPORT_PAGE_SIZE)
+
+        rows = []
+        for i in items:
+            price = prices.get(i["sku"], {}).get("price", 0)
+            row = {
+                **i,
+                "unit_price": price,
+                "stock_value": price * (i.get("quantity_on_hand") or 0),
+                **movements.get((i["sku"], i.get("warehouse_code")), dict.fromkeys(MOVEMENT_FIELDS, 0))
+            }
+            rows.append({k: row.get(k) for k in EXPORT_FIELDS})
+        yield rows
+
+def iter_export(fmt, pages):
+    """Serialize per halaman -> 1 chunk bytes per halaman."""
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for rows in pages:
+            writer.writerows(rows)
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue().encode("utf-8")
+    else:
+        for rows in pages:
+            yield "".join(json.dumps(r) + "\n" for r in rows).encode("utf-8")
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = format gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def to_streaming_error(resp):
+    # Helper auth mengembalikan func.HttpResponse; route streaming butuh Response dari extension
+    return Response(content=resp.get_body(), status_code=resp.status_code, media_type="application/json")
+
+@app.route(route="report/export", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+async def export_report(req: Request) -> StreamingResponse:
+    claims, err = require_user(req)
+    if err:
+        return to_streaming_error(err)
+
+    fmt = req.query_params.get("format", "csv").lower()
+    if fmt not in EXPORT_CONTENT_TYPES:
+        return to_streaming_error(error("format must be csv or ndjson", 400))
+    try:
+        start, end = parse_date_range(req.query_params)
+    except ValueError:
+        return to_streaming_error(error("from/to must be YYYY-MM-DD", 400))
+
+    # Generator sync: dijalankan di threadpool oleh StreamingResponse, event loop tidak ter-block
+    body = iter_export(fmt, iter_export_pages(claims["tenantId"], start, end))
+    headers = {"Content-Disposition": f'attachment; filename="inventory_report.{fmt}"'}
+    if "gzip" in req.headers.get("Accept-Encoding", ""):
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=EXPORT_CONTENT_TYPES[fmt], headers=headers)
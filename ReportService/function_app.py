@@ -5,19 +5,56 @@ import logging
 import requests
 import os
 import json, os, sys
+import heapq
+import math
+import operator
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from azure.cosmos import exceptions
+try:
+    import numpy as np
+except ImportError:  # fallback ke array stdlib
+    np = None
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from utils.auth import require_role, require_user, error
+from utils.inventory_store import (
+    get_container, iter_report_rows, list_tenants, inventory_version, products_version,
+    accumulate_movement, CONTAINER_INVENTORY, CONTAINER_LEDGER, MOVEMENT_FIELDS
+)
 
 app = func.FunctionApp()
 
 # Ambil token dan path dari environment (local.settings.json)
 TOKEN = os.getenv("AUTH_TOKEN")
 INVENTORIES_DB_PATH = os.getenv("REPORT_DB_PATH")
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT_ID", "T001")
 
-def load_inventories(req: func.HttpRequest):
+# cosmos = baca langsung lewat utils.inventory_store, http = fallback lewat InventoryService API
+REPORT_DATA_SOURCE = os.environ.get("REPORT_DATA_SOURCE", "cosmos")
+INVENTORY_API_URL = os.environ.get("INVENTORY_API_URL", "http://localhost:7073/api/inventory")
+CONTAINER_ROLLUPS = os.environ.get("ROLLUP_CONTAINER", "sales_rollups")
+CONTAINER_TENANT_REPORTS = os.environ.get("TENANT_REPORT_CONTAINER", "tenant_reports")
+REPORT_MAX_WORKERS = int(os.environ.get("REPORT_MAX_WORKERS", "8"))
+REPORT_TIME_BUDGET_SEC = int(os.environ.get("REPORT_TIME_BUDGET_SEC", "50"))  # jadwal tiap 60 detik
+ROLLUP_MAX_WORKERS = int(os.environ.get("ROLLUP_MAX_WORKERS", "8"))
+SALES_MAX_DAYS = int(os.environ.get("REPORT_SALES_MAX_DAYS", "366"))
+# Sumber http tidak punya version stamp -> aggregates di-rebuild kalau sudah lebih tua dari ini
+REPORT_AGGREGATES_MAX_AGE_SEC = int(os.environ.get("REPORT_AGGREGATES_MAX_AGE_SEC", "300"))
+
+def load_inventories_cosmos(tenant_id=None):
+    try:
+        return list(iter_report_rows(tenant_id)), None
+    except Exception as e:
+        return None, str(e)
+
+def load_inventories(req: func.HttpRequest, tenant_id=None):
+    if REPORT_DATA_SOURCE == "cosmos":
+        return load_inventories_cosmos(tenant_id)
     try:
         data = requests.get(
-            "http://localhost:7073/api/inventory",
+            INVENTORY_API_URL,
             headers={
                 "Authorization": req.headers.get("Authorization")
             }
@@ -27,58 +64,618 @@ def load_inventories(req: func.HttpRequest):
         return None, str(e)
     
 def load_inventories2():
+    if REPORT_DATA_SOURCE == "cosmos":
+        return load_inventories_cosmos()
     try:
         headers = {"Authorization": f"Bearer {TOKEN}"}
         response = requests.get(
-            "http://localhost:7073/api/inventory",
+            INVENTORY_API_URL,
             headers=headers
         )
         return response.json(), None
     except Exception as e:
         return None, str(e)
 
+# ==========================================
+# COLUMNAR AGGREGATION
+# ==========================================
+REPORT_TOP_N = int(os.getenv("REPORT_TOP_N", "5"))
+REPORT_PERCENTILES = [50, 90, 99]
+
+def _factorize(labels):
+    """Label -> kode integer (urutan kemunculan), O(n) tanpa sort."""
+    index = {}
+    codes = array("l", (index.setdefault(k, len(index)) for k in labels))
+    return codes, list(index)
+
+def to_columns(inventories):
+    """List of dict -> kolom (NumPy array, atau array stdlib kalau NumPy tidak ada)."""
+    n = len(inventories)
+    price = array("d", (p["product"]["price"] or 0 for p in inventories))
+    available = array("d", (p.get("available_qty", 0) for p in inventories))
+    sold = array("d", (p.get("sold_qty", 0) for p in inventories))
+    reserved = array("d", (p.get("reserved_qty", 0) for p in inventories))
+    warehouse, warehouse_keys = _factorize(p.get("warehouse_code") or "UNASSIGNED" for p in inventories)
+    tenant, tenant_keys = _factorize(p.get("tenantId") or DEFAULT_TENANT for p in inventories)
+
+    cols = {"price": price, "available": available, "sold": sold, "reserved": reserved, "warehouse": warehouse, "tenant": tenant}
+    if np is not None:
+        # Zero-copy dari buffer array stdlib
+        cols = {k: np.frombuffer(v, dtype=np.float64 if v.typecode == "d" else np.int_, count=n) for k, v in cols.items()}
+    cols["value"] = cols["price"] * cols["available"] if np is not None else array("d", map(operator.mul, price, available))
+    return cols, {"warehouse": warehouse_keys, "tenant": tenant_keys}
+
+def _top_n(value, k):
+    k = min(k, len(value))
+    if k == 0: return []
+    if np is not None:
+        idx = np.argpartition(-value, k - 1)[:k]
+        return idx[np.argsort(-value[idx], kind="stable")].tolist()
+    return heapq.nlargest(k, range(len(value)), key=value.__getitem__)
+
+def _percentiles(value, qs):
+    if np is not None:
+        return dict(zip(qs, np.percentile(value, qs).tolist()))
+    ordered = sorted(value)
+    last = len(ordered) - 1
+    result = {}
+    for q in qs:
+        # Interpolasi linear, sama dengan default np.percentile
+        pos = last * q / 100
+        lo = int(pos)
+        hi = min(lo + 1, last)
+        result[q] = ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+    return result
+
+def _group_sum(codes, keys, columns):
+    if np is not None:
+        return {name: dict(zip(keys, np.bincount(codes, weights=col, minlength=len(keys)).tolist())) for name, col in columns.items()}
+    result = {}
+    for name, col in columns.items():
+        sums = [0.0] * len(keys)
+        for c, v in zip(codes, col):
+            sums[c] += v
+        result[name] = dict(zip(keys, sums))
+    return result
+
+def compute_inventory_stats(inventories, top_n=REPORT_TOP_N):
+    cols, keys = to_columns(inventories)
+    value = cols["value"]
+    summed = {"available": cols["available"], "value": value}
+    return {
+        "total_inventories": len(inventories),
+        "total_value": float(value.sum()) if np is not None else math.fsum(value),
+        "total_available": float(cols["available"].sum()) if np is not None else math.fsum(cols["available"]),
+        "total_sold": float(cols["sold"].sum()) if np is not None else math.fsum(cols["sold"]),
+        "total_reserved": float(cols["reserved"].sum()) if np is not None else math.fsum(cols["reserved"]),
+        "value_percentiles": _percentiles(value, REPORT_PERCENTILES),
+        "top": _top_n(value, top_n),
+        "by_warehouse": _group_sum(cols["warehouse"], keys["warehouse"], summed),
+        "by_tenant": _group_sum(cols["tenant"], keys["tenant"], summed),
+    }
+
 def generate_inventory_report(inventories):
     if not inventories:
         return {"error": "No inventories found"}
-    total_inventories = len(inventories)
-    total_value = sum(p["product"]["price"] * p["available_qty"] for p in inventories)
+    stats = compute_inventory_stats(inventories)
+    total_inventories = stats["total_inventories"]
 
     report_lines = [
         f"=== Scheduled Inventory Report ===",
         f"Generated at: {datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC",
         f"Total inventories: {total_inventories}",
-        f"Total inventory value: {total_value:,} IDR",
+        f"Total inventory value: {stats['total_value']:,.0f} IDR",
+        "Value percentiles: " + ", ".join(f"p{q} {v:,.0f} IDR" for q, v in stats["value_percentiles"].items()),
         "Top products:"
     ]
 
-    for i, p in enumerate(inventories[:5], start=1):
+    for i, idx in enumerate(stats["top"], start=1):
+        p = inventories[idx]
         report_lines.append(f"{i}. {p['product']['name']} - Price: {p['product']['price']:,} IDR, Available Stock: {p['available_qty']}, Sold: {p['sold_qty']}, In Process {p['reserved_qty']}")
 
-    if total_inventories > 5:
-        report_lines.append(f"... and {total_inventories - 5} more products")
+    if total_inventories > len(stats["top"]):
+        report_lines.append(f"... and {total_inventories - len(stats['top'])} more products")
+
+    for label, group in [("Per warehouse", stats["by_warehouse"]), ("Per tenant", stats["by_tenant"])]:
+        report_lines.append(f"{label}:")
+        for key in sorted(group["value"]):
+            report_lines.append(f"- {key}: {group['available'][key]:,.0f} pcs, {group['value'][key]:,.0f} IDR")
 
     return "\n".join(report_lines)
 
+# ==========================================
+# INCREMENTAL REPORT ENGINE
+# ==========================================
+class InventoryAggregates:
+    """
+    State report yang di-update per event (STOCK_CHANGED / PRODUCT_*), bukan dihitung ulang tiap jadwal.
+    Row disimpan dalam format yang sama dengan /api/inventory:
+    {"sku", "product": {"name", "price"}, "available_qty", "sold_qty", "reserved_qty", "tenantId", "warehouses": {code: qty}}
+
+    Subscription report-service-sub competing consumer: tiap instance hanya menerima sebagian event.
+    Sumber kebenaran tetap Cosmos -> event hanya menjaga state tetap segar di antara rebuild,
+    dan scheduled_report me-rebuild begitu source_version (stamp Cosmos) berubah.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.total_value = 0
+        self.total_available = 0
+        self.by_warehouse = {}  # warehouse_code -> {"available", "value"}
+        self.by_tenant = {}     # tenantId -> {"count", "available", "value"}
+        self.version = 0
+        self.built_at = None
+        self.source_version = None  # stamp Cosmos yang dibaca sebelum load rebuild terakhir
+        self.pending = None         # event yang masuk selama load rebuild (None = tidak sedang rebuild)
+
+    @staticmethod
+    def row_key(row):
+        return row.get("sku") or (row.get("product") or {}).get("sku") or row.get("inventory_id")
+
+    def _apply(self, row, sign):
+        # sign = +1 tambah kontribusi row, -1 cabut kontribusi row lama
+        price = (row.get("product") or {}).get("price") or 0
+        available = row.get("available_qty", 0)
+        value = price * available
+        self.total_value += sign * value
+        self.total_available += sign * available
+
+        tenant = self.by_tenant.setdefault(row.get("tenantId") or DEFAULT_TENANT, {"count": 0, "available": 0, "value": 0})
+        tenant["count"] += sign
+        tenant["available"] += sign * available
+        tenant["value"] += sign * value
+
+        warehouses = row.get("warehouses") or {row.get("warehouse_code") or "UNASSIGNED": available}
+        for code, qty in warehouses.items():
+            wh = self.by_warehouse.setdefault(code, {"available": 0, "value": 0})
+            wh["available"] += sign * qty
+            wh["value"] += sign * price * qty
+
+    def _put(self, key, row):
+        old = self.rows.get(key)
+        if old is not None:
+            self._apply(old, -1)
+        self._apply(row, 1)
+        self.rows[key] = row
+        self.version += 1
+
+    def begin_rebuild(self):
+        """Dipanggil SEBELUM load data: event selama load di-buffer untuk di-replay setelah swap."""
+        with self.lock:
+            self.pending = []
+
+    def cancel_rebuild(self):
+        with self.lock:
+            self.pending = None
+
+    def rebuild(self, inventories, source_version=None):
+        """Full rebuild (startup / on demand)."""
+        with self.lock:
+            self.rows, self.by_warehouse, self.by_tenant = {}, {}, {}
+            self.total_value = self.total_available = 0
+            merged = {}
+            for row in inventories:
+                # Sumber cosmos: 1 row per (sku, warehouse) -> digabung jadi 1 row per sku
+                key = self.row_key(row)
+                warehouses = row.get("warehouses") or {row.get("warehouse_code") or "UNASSIGNED": row.get("available_qty", 0)}
+                cur = merged.get(key)
+                if cur is None:
+                    merged[key] = {**row, "warehouses": dict(warehouses)}
+                    continue
+                for code, qty in warehouses.items():
+                    cur["warehouses"][code] = cur["warehouses"].get(code, 0) + qty
+                for f in ["available_qty", "sold_qty", "reserved_qty"]:
+                    cur[f] = cur.get(f, 0) + row.get(f, 0)
+            for key, row in merged.items():
+                self._put(key, row)
+            # Event yang masuk selama load belum tentu ada di data -> replay.
+            # Event membawa nilai absolut (stok / harga), jadi aman walau sudah ikut ter-load.
+            for event in self.pending or []:
+                self._apply_event(event)
+            self.pending = None
+            self.source_version = source_version
+            self.built_at = datetime.datetime.utcnow()
+
+    def apply_event(self, event):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append(event)
+            self._apply_event(event)
+
+    def _apply_event(self, event):
+        sku = event.get("sku")
+        action = event.get("action")
+        data = event.get("data") or {}
+        if not sku: return
+
+        old = self.rows.get(sku)
+        row = dict(old) if old else {
+            "sku": sku, "product": {"name": data.get("name"), "price": 0},
+            "available_qty": 0, "sold_qty": 0, "reserved_qty": 0,
+            "tenantId": data.get("tenantId") or DEFAULT_TENANT, "warehouses": {}
+        }
+        row["product"] = dict(row.get("product") or {})
+        if data.get("name"): row["product"]["name"] = data["name"]
+
+        if action == "STOCK_CHANGED":
+            # quantity di event ini = available per gudang
+            row["warehouses"] = _warehouse_quantities(data)
+            row["available_qty"] = int(data.get("total_available", sum(row["warehouses"].values())))
+        elif action in ["PRODUCT_CREATED", "PRODUCT_UPDATED"]:
+            if data.get("base_price") is not None: row["product"]["price"] = data["base_price"]
+            if data.get("tenantId"): row["tenantId"] = data["tenantId"]
+            if old is None:
+                # Stok awal dari product; selanjutnya diikuti oleh STOCK_CHANGED
+                row["warehouses"] = _warehouse_quantities(data)
+                row["available_qty"] = sum(row["warehouses"].values())
+        else:
+            return
+        self._put(sku, row)
+
+    def snapshot(self, top_n=5):
+        with self.lock:
+            top = heapq.nlargest(top_n, self.rows.values(), key=lambda r: ((r.get("product") or {}).get("price") or 0) * r.get("available_qty", 0))
+            return {
+                "version": self.version,
+                "total_inventories": len(self.rows),
+                "total_value": self.total_value,
+                "total_available": self.total_available,
+                "by_warehouse": {k: dict(v) for k, v in self.by_warehouse.items()},
+                "by_tenant": {k: dict(v) for k, v in self.by_tenant.items()},
+                "top": [dict(r) for r in top],
+            }
+
+def _warehouse_quantities(data):
+    """{warehouse_code: qty} dari event; entry tanpa warehouse_code masuk ke "UNASSIGNED"."""
+    warehouses = {}
+    for w in data.get("warehouses") or []:
+        code = w.get("warehouse_code") or "UNASSIGNED"
+        warehouses[code] = warehouses.get(code, 0) + int(w.get("quantity", 0))
+    return warehouses
+
+aggregates = InventoryAggregates()
+
+def format_aggregate_report(snap):
+    report_lines = [
+        f"=== Scheduled Inventory Report ===",
+        f"Generated at: {datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC",
+        f"Total inventories: {snap['total_inventories']}",
+        f"Total inventory value: {snap['total_value']:,} IDR",
+        "Top products:"
+    ]
+    for i, p in enumerate(snap["top"], start=1):
+        report_lines.append(f"{i}. {p['product']['name']} - Price: {p['product']['price']:,} IDR, Available Stock: {p['available_qty']}, Sold: {p.get('sold_qty', 0)}, In Process {p.get('reserved_qty', 0)}")
+    if snap["total_inventories"] > len(snap["top"]):
+        report_lines.append(f"... and {snap['total_inventories'] - len(snap['top'])} more products")
+
+    report_lines.append("Per warehouse:")
+    for code, wh in sorted(snap["by_warehouse"].items()):
+        report_lines.append(f"- {code}: {wh['available']} pcs, {wh['value']:,} IDR")
+    report_lines.append("Per tenant:")
+    for tenant, t in sorted(snap["by_tenant"].items()):
+        report_lines.append(f"- {tenant}: {t['count']} products, {t['available']} pcs, {t['value']:,} IDR")
+    return "\n".join(report_lines)
+
+rebuild_lock = threading.Lock()  # timer & POST report/rebuild tidak rebuild bersamaan
+
+def source_version():
+    """Stamp Cosmos (inventory + harga produk); None untuk sumber http."""
+    if REPORT_DATA_SOURCE != "cosmos":
+        return None
+    return f"{inventory_version()}:{products_version()}"
+
+def aggregates_stale():
+    if aggregates.built_at is None:
+        return True
+    if REPORT_DATA_SOURCE == "cosmos":
+        return source_version() != aggregates.source_version
+    return datetime.datetime.utcnow() - aggregates.built_at > datetime.timedelta(seconds=REPORT_AGGREGATES_MAX_AGE_SEC)
+
+def rebuild_aggregates():
+    with rebuild_lock:
+        # Stamp dibaca SEBELUM data -> perubahan di tengah load terdeteksi di jadwal berikutnya
+        version = source_version()
+        aggregates.begin_rebuild()
+        try:
+            inventories, err = load_inventories2()
+            if err:
+                return err
+            aggregates.rebuild(inventories or [], version)
+        finally:
+            aggregates.cancel_rebuild()  # no-op kalau rebuild sukses
+    logging.info(f"[Report] Aggregates rebuilt: {len(aggregates.rows)} rows")
+    return None
+
+@app.service_bus_topic_trigger(
+    arg_name="msg",
+    topic_name="product-events",
+    subscription_name="report-service-sub",
+    connection="SERVICE_BUS_CONNECTION"
+)
+def process_report_events(msg: func.ServiceBusMessage):
+    try:
+        aggregates.apply_event(json.loads(msg.get_body().decode("utf-8")))
+    except Exception as e:
+        logging.error(f"[Report] Failed to apply event: {e}")
+
+# ==========================================
+# PER-TENANT SCHEDULED REPORTS
+# ==========================================
+def get_tenant_report_container():
+    return get_container(CONTAINER_TENANT_REPORTS, partition_key="/tenantId")
+
+def run_tenant_report(tenant_id, catalog_version, deadline):
+    """Return status: written | skipped (version sama) | deferred (lewat time budget)."""
+    if time.time() > deadline:
+        return "deferred"
+
+    # Stamp dibaca SEBELUM data -> kalau ada perubahan di tengah jalan, run berikutnya hitung ulang
+    version = f"{inventory_version(tenant_id)}:{catalog_version}"
+    ctr = get_tenant_report_container()
+    try:
+        last = ctr.read_item(item="latest", partition_key=tenant_id)
+        if last.get("version") == version:
+            return "skipped"
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+
+    inventories, err = load_inventories_cosmos(tenant_id)
+    if err:
+        raise Exception(err)
+    ctr.upsert_item(body={
+        "id": "latest",
+        "tenantId": tenant_id,
+        "version": version,
+        "generated_at": datetime.datetime.utcnow().isoformat() + "Z",
+        "report": generate_inventory_report(inventories)
+    })
+    return "written"
+
+def run_tenant_reports():
+    tenants = list_tenants()
+    if not tenants:
+        return {}
+    catalog_version = products_version()
+    deadline = time.time() + REPORT_TIME_BUDGET_SEC
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(REPORT_MAX_WORKERS, len(tenants))) as pool:
+        futures = {pool.submit(run_tenant_report, t, catalog_version, deadline): t for t in tenants}
+        for future in as_completed(futures):
+            tenant_id = futures[future]
+            try:
+                status = future.result()
+            except Exception as e:
+                logging.error(f"[Report] Tenant {tenant_id} failed: {e}")
+                status = "failed"
+            results[status] = results.get(status, 0) + 1
+    return results
+
 @app.schedule(schedule="0 */1 * * * *", arg_name="timer", run_on_startup=True, use_monitor=False)
 def scheduled_report(timer: func.TimerRequest) -> None:
     try:
-        inventories, err = load_inventories2()
-        if err:
-            logging.error(f"Failed to load inventories: {err}")
-            return
-        report = generate_inventory_report(inventories)
-        logging.info(report)
+        # Full rebuild di startup dan setiap kali data di Cosmos berubah: event yang diterima
+        # instance ini hanya sebagian (competing consumer), jadi tidak cukup untuk menjaga state
+        if aggregates_stale():
+            err = rebuild_aggregates()
+            if err:
+                logging.error(f"Failed to load inventories: {err}")
+                return
+        logging.info(format_aggregate_report(aggregates.snapshot()))
+
+        if REPORT_DATA_SOURCE == "cosmos":
+            results = run_tenant_reports()
+            logging.info(f"[Report] Tenant reports: {results}")
     except Exception as e:
-        logging.error(f"Scheduled report error: {e}")
+        logging.error(f"Scheduled report error: {e}")
+
+@app.route(route="report/rebuild", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
+def rebuild_report(req: func.HttpRequest) -> func.HttpResponse:
+    claims, err = require_user(req)
+    if err:
+        return err
+    if not require_role(claims, ["Owner"]):
+        return error("owner_only", 403)
+
+    err = rebuild_aggregates()
+    if err:
+        return func.HttpResponse(f"Failed to load inventories: {err}", status_code=500)
+    snap = aggregates.snapshot()
+    snap.pop("top")
+    return func.HttpResponse(json.dumps(snap), mimetype="application/json", status_code=200)
+
+# ==========================================
+# REPORT CACHE (per tenant, single-flight)
+# ==========================================
+REPORT_INTERVAL_SEC = 60  # sama dengan jadwal scheduled_report (tiap menit)
+REPORT_WAIT_TIMEOUT_SEC = float(os.environ.get("REPORT_WAIT_TIMEOUT_SEC", "30"))
+
+report_cache = {}     # tenantId -> (expires_at, generated_at, report)
+report_inflight = {}  # tenantId -> threading.Event
+report_cache_lock = threading.Lock()
+
+def get_cached_report(tenant_id, compute):
+    """
+    Return (entry, cache_status, err). Cache habis di batas interval scheduler berikutnya,
+    request bersamaan untuk tenant yang sama hanya memicu 1x compute.
+    """
+    while True:
+        with report_cache_lock:
+            entry = report_cache.get(tenant_id)
+            if entry and entry[0] > time.time():
+                return entry, "HIT", None
+            event = report_inflight.get(tenant_id)
+            leader = event is None
+            if leader:
+                event = report_inflight[tenant_id] = threading.Event()
+
+        if not leader:
+            # Tunggu hasil compute yang sedang jalan, lalu cek cache lagi
+            if not event.wait(REPORT_WAIT_TIMEOUT_SEC):
+                return None, "MISS", "report computation timed out"
+            continue
+
+        try:
+            report, err = compute()
+            if err:
+                return None, "MISS", err
+            now = time.time()
+            entry = ((now // REPORT_INTERVAL_SEC + 1) * REPORT_INTERVAL_SEC, datetime.datetime.utcnow().isoformat() + "Z", report)
+            with report_cache_lock:
+                report_cache[tenant_id] = entry
+            return entry, "MISS", None
+        finally:
+            with report_cache_lock:
+                report_inflight.pop(tenant_id, None)
+            event.set()
 
 @app.route(route="report/run", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
 def run_report(req: func.HttpRequest) -> func.HttpResponse:
     claims, err = require_user(req)
     if err: 
         return err
-    
-    inventories, err = load_inventories(req)
+
+    def compute():
+        inventories, err = load_inventories(req, claims["tenantId"])
+        if err:
+            return None, err
+        return generate_inventory_report(inventories), None
+
+    entry, cache_status, err = get_cached_report(claims["tenantId"], compute)
     if err:
         return func.HttpResponse(f"Failed to load inventories: {err}", status_code=500)
-    report = generate_inventory_report(inventories)
-    return func.HttpResponse(json.dumps(report), mimetype="application/json", status_code=200)
\ No newline at end of file
+    expires_at, generated_at, report = entry
+    return func.HttpResponse(
+        json.dumps({"generated_at": generated_at, "report": report}),
+        mimetype="application/json",
+        status_code=200,
+        headers={"X-Report-Cache": cache_status, "Cache-Control": f"private, max-age={max(0, int(expires_at - time.time()))}"}
+    )
+
+# ==========================================
+# DAILY ROLLUPS (sku, warehouse, day)
+# ==========================================
+def get_rollup_container():
+    # Partition Key: /day -> laporan date-range cukup menyentuh beberapa partisi hari
+    return get_container(CONTAINER_ROLLUPS, partition_key="/day")
+
+def resolve_row_tenant(sku, warehouse_code):
+    try:
+        row = get_container(CONTAINER_INVENTORY).read_item(item=f"{sku}_{warehouse_code}", partition_key=sku)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+    return row.get("tenantId")
+
+def rebuild_rollup(sku, warehouse_code, day):
+    """
+    Hitung ulang 1 dokumen rollup dari ledger hari itu (query dalam 1 partisi /sku).
+    Recompute (bukan increment) supaya aman terhadap redelivery change feed.
+    """
+    next_day = (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+    query = """
+        SELECT c.reason, c.change_amount, c.price, c.tenantId FROM c
+        WHERE c.warehouse_code = @wh AND c.timestamp >= @day AND c.timestamp < @next
+    """
+    items = get_container(CONTAINER_LEDGER).query_items(
+        query=query,
+        parameters=[{"name": "@wh", "value": warehouse_code}, {"name": "@day", "value": day}, {"name": "@next", "value": next_day}],
+        partition_key=sku
+    )
+
+    movement = dict.fromkeys(MOVEMENT_FIELDS, 0)
+    tenant_id = None
+    entries = 0
+    for e in items:
+        accumulate_movement(movement, e)
+        tenant_id = tenant_id or e.get("tenantId")
+        entries += 1
+    if not tenant_id:
+        # Ledger lama belum menyimpan tenantId -> ambil dari row inventory-nya
+        tenant_id = resolve_row_tenant(sku, warehouse_code)
+
+    get_rollup_container().upsert_item(body={
+        "id": f"{sku}_{warehouse_code}_{day}",
+        "day": day,
+        "sku": sku,
+        "warehouse_code": warehouse_code,
+        "tenantId": tenant_id or DEFAULT_TENANT,
+        **movement,
+        "entries": entries,
+        "updated_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
+    })
+
+@app.cosmos_db_trigger(
+    arg_name="docs",
+    connection="COSMOS_CONNECTION",
+    database_name="%COSMOS_DATABASE%",
+    container_name=CONTAINER_LEDGER,
+    lease_container_name="leases",
+    create_lease_container_if_not_exists=True,
+    start_from_beginning=True
+)
+def rollup_stock_ledger(docs: func.DocumentList):
+    # Satu batch change feed -> set (sku, warehouse, day) unik yang perlu dihitung ulang
+    keys = {(d["sku"], d.get("warehouse_code"), d["timestamp"][:10]) for d in docs if d.get("sku") and d.get("timestamp")}
+    if not keys: return
+
+    with ThreadPoolExecutor(max_workers=min(ROLLUP_MAX_WORKERS, len(keys))) as pool:
+        for key, result in zip(keys, pool.map(lambda k: _safe_rebuild_rollup(*k), keys)):
+            if result:
+                logging.error(f"[Rollup] Failed {key}: {result}")
+    logging.info(f"[Rollup] {len(docs)} ledger entries -> {len(keys)} rollups")
+
+def _safe_rebuild_rollup(sku, warehouse_code, day):
+    try:
+        rebuild_rollup(sku, warehouse_code, day)
+    except Exception as e:
+        return str(e)
+    return None
+
+@app.route(route="report/sales", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def sales_report(req: func.HttpRequest) -> func.HttpResponse:
+    claims, err = require_user(req)
+    if err:
+        return err
+
+    try:
+        today = datetime.datetime.utcnow().date()
+        date_to = datetime.date.fromisoformat(req.params.get("to") or today.isoformat())
+        date_from = datetime.date.fromisoformat(req.params.get("from") or (date_to - datetime.timedelta(days=29)).isoformat())
+    except ValueError:
+        return error("from/to must be YYYY-MM-DD", 400)
+    if date_from > date_to or (date_to - date_from).days >= SALES_MAX_DAYS:
+        return error(f"invalid range (max {SALES_MAX_DAYS} days)", 400)
+
+    query = """
+        SELECT c.day, c.sku, c.warehouse_code, c.received, c.adjusted, c.reserved, c.cancelled, c.fulfilled, c.revenue
+        FROM c WHERE c.day >= @from AND c.day <= @to AND c.tenantId = @tenant
+    """
+    params = [
+        {"name": "@from", "value": date_from.isoformat()},
+        {"name": "@to", "value": date_to.isoformat()},
+        {"name": "@tenant", "value": claims["tenantId"]}
+    ]
+    sku = req.params.get("sku")
+    if sku:
+        query += " AND c.sku = @sku"
+        params.append({"name": "@sku", "value": sku})
+
+    try:
+        rows = get_rollup_container().query_items(query=query, parameters=params, enable_cross_partition_query=True)
+        by_sku, by_day = {}, {}
+        totals = dict.fromkeys(MOVEMENT_FIELDS, 0)
+        for r in rows:
+            for bucket in (by_sku.setdefault(r["sku"], dict.fromkeys(MOVEMENT_FIELDS, 0)), by_day.setdefault(r["day"], dict.fromkeys(MOVEMENT_FIELDS, 0)), totals):
+                for f in MOVEMENT_FIELDS:
+                    bucket[f] += r.get(f) or 0
+    except Exception as e:
+        return func.HttpResponse(f"Error: {str(e)}", status_code=500)
+
+    result = {
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "totals": totals,
+        "by_sku": [{"sku": k, **v} for k, v in sorted(by_sku.items(), key=lambda kv: -kv[1]["revenue"])],
+        "by_day": [{"day": k, **v} for k, v in sorted(by_day.items())]
+    }
+    return func.HttpResponse(json.dumps(result), mimetype="application/json", status_code=200)
@@ -1,10 +1,15 @@
 import azure.functions as func
 from azure.cosmos import CosmosClient, exceptions
+from azure.core import MatchConditions
 import logging
 import json
 import os
 import datetime
-import requests # Digunakan untuk nembak API Mock
+import time
+import hashlib
+from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from marketplaces import build_adapters
 
 app = func.FunctionApp()
 
@@ -17,8 +22,16 @@ CONTAINER_NAME = os.environ.get("COSMOS_CONTAINER")    # Tempat simpan binding I
 # Jika di Azure, ganti dengan URL Function App Mock Anda
 MOCK_API_BASE_URL = os.environ.get("MOCK_API_URL")
 
+# Cache binding per SKU (in-process). Di-update (write-through) setiap kali binding di-upsert.
+BINDING_CACHE_TTL_SEC = int(os.environ.get("BINDING_CACHE_TTL_SEC", "60"))
+BINDING_CACHE_MAX = int(os.environ.get("BINDING_CACHE_MAX", "2048"))
+# Klaim create listing (binding PENDING) dianggap basi setelah ini -> boleh diambil alih
+BINDING_CLAIM_TIMEOUT_SEC = int(os.environ.get("BINDING_CLAIM_TIMEOUT_SEC", "300"))
+
 client = None
 container = None
+binding_cache = {}  # sku -> (expires_at, {marketplace: binding_doc})
+sync_stats = {"pushed": 0, "skipped_unchanged": 0}
 
 def get_container():
     global client, container
@@ -35,174 +48,359 @@ def get_container():
 def get_iso_timestamp():
     return datetime.datetime.now(datetime.timezone.utc).isoformat()
 
+def get_bindings(ctr, sku, use_cache=True):
+    """
+    Ambil semua binding marketplace untuk satu SKU dengan 1 query in-partition.
+    Hasil: dict {marketplace: binding_doc}, di-cache selama BINDING_CACHE_TTL_SEC.
+    Hasil kosong tidak di-cache: binding bisa dibuat instance lain kapan saja.
+    """
+    now = time.monotonic()
+    cached = binding_cache.get(sku)
+    if use_cache and cached and cached[0] > now:
+        return cached[1]
+
+    query = "SELECT * FROM c WHERE c.master_sku = @sku"
+    items = ctr.query_items(query=query, parameters=[{"name": "@sku", "value": sku}], partition_key=sku)
+    bindings = {b['marketplace']: b for b in items}
+    if not bindings:
+        binding_cache.pop(sku, None)
+        return bindings
+
+    # Cache kecil: buang entry paling lama kalau sudah penuh
+    if sku not in binding_cache and len(binding_cache) >= BINDING_CACHE_MAX:
+        binding_cache.pop(next(iter(binding_cache)))
+    binding_cache[sku] = (now + BINDING_CACHE_TTL_SEC, bindings)
+    return bindings
+
+def payload_hash(payload):
+    """Fingerprint stabil dari payload (urutan key tidak berpengaruh)."""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def save_binding(ctr, binding):
+    """Upsert binding lalu tulis hasilnya ke cache SKU (write-through, tanpa query ulang)."""
+    saved = ctr.upsert_item(binding) or binding
+    sku = binding['master_sku']
+    cached = binding_cache.get(sku)
+    if cached and cached[0] > time.monotonic():
+        # Dict baru (bukan mutate) supaya caller lain yang sedang iterasi tidak kena race
+        binding_cache[sku] = (cached[0], {**cached[1], saved['marketplace']: saved})
+
+def claim_binding(ctr, sku, marketplace, doc=None):
+    """
+    Create-if-not-exists binding PENDING sebelum create listing di marketplace.
+    Dua instance yang create bersamaan bentrok di id binding (409) -> hanya satu yang POST.
+    Klaim PENDING yang basi (instance crash di tengah jalan) diambil alih dengan etag.
+    Return True kalau instance ini pemegang klaim.
+    """
+    claim = {
+        "id": f"{marketplace}_{sku}", "master_sku": sku, "marketplace": marketplace,
+        "sync_status": "PENDING", "claimed_at": get_iso_timestamp()
+    }
+    try:
+        if doc is None:
+            ctr.create_item(body=claim)
+        else:
+            ctr.replace_item(item=doc['id'], body=claim, etag=doc['_etag'], match_condition=MatchConditions.IfNotModified)
+        return True
+    except (exceptions.CosmosResourceExistsError, exceptions.CosmosAccessConditionFailedError):
+        binding_cache.pop(sku, None)
+        return False
+
+def release_binding_claim(ctr, sku, marketplace):
+    """Create listing gagal -> hapus klaim supaya event berikutnya bisa mencoba lagi."""
+    try:
+        ctr.delete_item(item=f"{marketplace}_{sku}", partition_key=sku)
+    except exceptions.CosmosResourceNotFoundError:
+        pass
+
+def claim_is_stale(doc):
+    claimed_at = datetime.datetime.fromisoformat(doc.get('claimed_at') or "1970-01-01T00:00:00+00:00")
+    age = datetime.datetime.now(datetime.timezone.utc) - claimed_at
+    return age.total_seconds() > BINDING_CLAIM_TIMEOUT_SEC
+
 # ==========================================
-# 1. PAYLOAD BUILDERS (Transformasi Data)
+# 1. MARKETPLACE ADAPTERS (lihat marketplaces.py)
 # ==========================================
+# Lookup O(1) per marketplace; channel tanpa adapter di-skip.
+ADAPTERS = build_adapters(MOCK_API_BASE_URL)
+SYNC_MAX_WORKERS = int(os.environ.get("SYNC_MAX_WORKERS", "8"))
 
-def build_tokopedia_payload(data):
-    # Mapping Warehouse Internal -> Tokopedia Inventory
-    inv_list = []
-    for w in data.get('warehouses', []):
-        inv_list.append({
-            "warehouse_id": w.get('warehouse_code', 'WH-DEFAULT'),
-            "quantity": int(w.get('quantity', 0))
-        })
-    
-    return {
-        "title": data.get('name'),
-        "status": "ACTIVATE" if data.get('status') == 'ACTIVE' else "DEACTIVATE",
-        "skus": [{
-            "seller_sku": data.get('sku'),
-            "price": { "amount": str(data.get('base_price', 0)), "currency": "IDR" },
-            "inventory": inv_list
-        }],
-        "main_images": [{"urls": data.get('images', [])}]
-    }
+# ==========================================
+# 2. STOCK BATCHING (Cross-SKU)
+# ==========================================
+def push_stock_batches(ctr, stock_events):
+    """
+    stock_events: {sku: data STOCK_CHANGED terbaru}.
+    Kelompokkan per (marketplace, shop) lalu kirim per chunk sesuai stock_batch_max adapter.
+    """
+    groups = {}  # (marketplace, shop_id) -> [(binding, entry, fingerprint)]
+    for sku, data in stock_events.items():
+        for b in get_bindings(ctr, sku).values():
+            adapter = ADAPTERS.get(b['marketplace'])
+            if not adapter or not b.get('external_id'): continue  # listing masih dibuat (PENDING)
+            entry = adapter.build_stock_entry(b, data)
 
-def build_shopee_payload(data):
-    # Hitung total stok & struktur seller stock
-    total = 0
-    seller_stock = []
-    for w in data.get('warehouses', []):
-        qty = int(w.get('quantity', 0))
-        total += qty
-        seller_stock.append({
-            "location_id": w.get('warehouse_code', 'WH-DEFAULT'),
-            "stock": qty
-        })
-    
-    # Payload Create Item
-    return {
-        "item_name": data.get('name'),
-        "item_sku": data.get('sku'),
-        "item_status": "NORMAL",
-        "original_price": int(data.get('base_price', 0)),
-        "seller_stock": seller_stock, # Format simplified untuk mock add_item
-        "image": { "image_url_list": data.get('images', []) }
-    }
+            fingerprint = payload_hash(entry)
+            if b.get('last_stock_hash') == fingerprint:
+                sync_stats["skipped_unchanged"] += 1
+                continue
+            groups.setdefault((adapter.name, adapter.shop_of(b)), []).append((b, entry, fingerprint))
 
-def build_lazada_payload(data):
-    # Lazada Payload dibungkus object 'payload'
-    total = sum(int(w.get('quantity', 0)) for w in data.get('warehouses', []))
-    
-    return {
-        "payload": {
-            "Attributes": {
-                "name": data.get('name'),
-                "short_description": data.get('description', '')
-            },
-            "Skus": [{
-                "SellerSku": data.get('sku'),
-                "quantity": total,
-                "price": int(data.get('base_price', 0)),
-                "Images": data.get('images', [])
-            }]
+    send_stock_groups(ctr, groups)
+
+def send_stock_groups(ctr, groups):
+    """groups: {(marketplace, shop_id): [(binding, entry, fingerprint)]} -> kirim per chunk secara paralel."""
+    jobs = []  # (marketplace, shop_id, chunk)
+    for (marketplace, shop_id), items in groups.items():
+        size = ADAPTERS[marketplace].stock_batch_max
+        for i in range(0, len(items), size):
+            jobs.append((marketplace, shop_id, items[i:i + size]))
+    if not jobs: return
+
+    # Kirim semua chunk secara paralel (rate limit dijaga oleh adapter)
+    with ThreadPoolExecutor(max_workers=SYNC_MAX_WORKERS) as pool:
+        futures = {
+            pool.submit(ADAPTERS[m].send_stock, [(b, e) for b, e, _ in chunk]): (m, shop_id, chunk)
+            for m, shop_id, chunk in jobs
         }
-    }
+        for fut in as_completed(futures):
+            marketplace, shop_id, chunk = futures[fut]
+            try:
+                errors = fut.result()
+            except Exception as e:
+                logging.error(f"Failed stock batch {marketplace}/{shop_id}: {e}")
+                continue
+
+            for b, _, fingerprint in chunk:
+                sku = b['master_sku']
+                if sku in errors:
+                    logging.error(f"Failed stock push {marketplace} {sku}: {errors[sku]}")
+                    continue
+                sync_stats["pushed"] += 1  # hanya item yang sukses (bukan yang ada di failure_list)
+                save_binding(ctr, {**b, "last_stock_hash": fingerprint, "last_synced_at": get_iso_timestamp()})
+            logging.info(f"   -> Pushed Stock batch ({len(chunk)} SKU) to {marketplace}/{shop_id}, {len(errors)} failed")
 
 # ==========================================
-# 2. SYNC LOGIC (Service Bus Trigger)
+# 3. SYNC LOGIC (Service Bus Trigger)
 # ==========================================
+def sync_product(ctr, sku, action, data):
+    channels = data.get('connected_channels', [])
+    if not channels: return
+
+    # 1 query untuk semua channel (bukan read_item per marketplace)
+    bindings = get_bindings(ctr, sku)
+    if any(m in ADAPTERS and m not in bindings for m in channels):
+        # Channel tanpa binding akan di-create -> pastikan dari baca terbaru, bukan cache
+        bindings = get_bindings(ctr, sku, use_cache=False)
+
+    jobs = []  # (adapter, doc, url, payload, fingerprint)
+    for marketplace in channels:
+        adapter = ADAPTERS.get(marketplace)
+        if not adapter:
+            logging.warning(f"   -> No adapter for {marketplace}, skipped")
+            continue
+        try:
+            doc = bindings.get(marketplace)
+            if doc and not doc.get('external_id') and not claim_is_stale(doc):
+                # Binding PENDING: listing sedang dibuat instance lain
+                logging.info(f"   -> Skip {marketplace}: listing create in progress")
+                continue
+            payload = adapter.build_payload(data)
+
+            # Skip kalau field yang relevan untuk marketplace ini tidak berubah
+            fingerprint = payload_hash(payload)
+            if doc and doc.get('last_payload_hash') == fingerprint:
+                sync_stats["skipped_unchanged"] += 1
+                logging.info(f"   -> Skip {marketplace}: payload unchanged (skipped total: {sync_stats['skipped_unchanged']})")
+                continue
+
+            if not doc or not doc.get('external_id'):
+                # Create listing: klaim binding dulu (create-if-not-exists / ambil alih klaim basi)
+                if not claim_binding(ctr, sku, marketplace, doc):
+                    logging.info(f"   -> Skip {marketplace}: binding created concurrently")
+                    continue
+                doc = None
+
+            url = adapter.product_url(doc['external_id'] if doc else None)
+            jobs.append((adapter, doc, url, payload, fingerprint))
+        except Exception as e: logging.error(f"Failed sync {marketplace}: {e}")
+    if not jobs: return
+
+    # Eksekusi ke semua channel secara paralel
+    logging.info(f"   -> Sending {action} to {[j[0].name for j in jobs]}")
+    with ThreadPoolExecutor(max_workers=min(SYNC_MAX_WORKERS, len(jobs))) as pool:
+        futures = {
+            pool.submit(adapter.send, url, payload, 10, adapter.shop_of(doc)): (adapter, doc, fingerprint)
+            for adapter, doc, url, payload, fingerprint in jobs
+        }
+        for fut in as_completed(futures):
+            adapter, doc, fingerprint = futures[fut]
+            resp = None
+            try:
+                resp = fut.result()
+                if resp.status_code not in [200, 201]:
+                    logging.error(f"Failed sync {adapter.name}: HTTP {resp.status_code}")
+                    if not doc:
+                        release_binding_claim(ctr, sku, adapter.name)
+                    continue
+                sync_stats["pushed"] += 1
+
+                if doc:
+                    # Payload produk ikut membawa stok -> fingerprint stok terakhir sudah tidak mewakili
+                    # stok di marketplace, STOCK_CHANGED berikutnya harus dikirim walau nilainya sama
+                    save_binding(ctr, {
+                        **doc, "last_payload_hash": fingerprint, "last_stock_hash": None,
+                        "last_synced_at": get_iso_timestamp()
+                    })
+                else:
+                    # Simpan Binding (Jika Create)
+                    save_binding(ctr, {
+                        "id": f"{adapter.name}_{sku}", "master_sku": sku, "marketplace": adapter.name,
+                        "shop_id": adapter.shop_id, "external_id": adapter.extract_id(resp.json()), "sync_status": "LINKED",
+                        "last_synced_at": get_iso_timestamp(), "last_payload_hash": fingerprint
+                    })
+            except Exception as e:
+                logging.error(f"Failed sync {adapter.name}: {e}")
+                # Klaim hanya dilepas kalau request gagal terkirim; listing yang sudah dibuat
+                # (tapi binding gagal disimpan) jangan sampai di-create ulang
+                if not doc and resp is None:
+                    release_binding_claim(ctr, sku, adapter.name)
+
 @app.service_bus_topic_trigger(
-    arg_name="msg", 
+    arg_name="msgs", 
     topic_name="product-events", 
     subscription_name="sync-service-sub", 
-    connection="SERVICE_BUS_CONNECTION"
+    connection="SERVICE_BUS_CONNECTION",
+    cardinality=func.Cardinality.MANY
 )
-def process_sync_events(msg: func.ServiceBusMessage):
-    event = json.loads(msg.get_body().decode("utf-8"))
-    sku = event.get('sku')
-    action = event.get('action')
-    data = event.get('data', {})
-    
-    logging.info(f"[Sync] Processing {action} for {sku}")
+def process_sync_events(msgs: List[func.ServiceBusMessage]):
     ctr = get_container()
+    stock_events = {}  # sku -> data (event terakhir dalam batch yang dipakai)
 
-    # --- LOGIKA 1: CREATE / UPDATE INFO PRODUK ---
-    if action in ["PRODUCT_CREATED", "PRODUCT_UPDATED"]:
-        channels = data.get('connected_channels', [])
-        if not channels: return
+    for msg in msgs:
+        try:
+            event = json.loads(msg.get_body().decode("utf-8"))
+        except Exception as e:
+            logging.error(f"[Sync] Invalid message: {e}")
+            continue
 
-        for marketplace in channels:
-            try:
-                binding_id = f"{marketplace}_{sku}"
-                is_update = False
-                ext_id = None
-                
-                try:
-                    doc = ctr.read_item(item=binding_id, partition_key=sku)
-                    is_update = True
-                    ext_id = doc['external_id']
-                except exceptions.CosmosResourceNotFoundError: pass
-
-                # Tentukan URL & Payload (Sederhana)
-                url, payload = "", {}
-                if marketplace == "TOKOPEDIA":
-                    payload = build_tokopedia_payload(data)
-                    url = f"{MOCK_API_BASE_URL}/mock/tokopedia/product/202309/products" 
-                    if is_update: url += f"/{ext_id}/inventory/update" # Mock logic terbatas
-                
-                elif marketplace == "SHOPEE":
-                    payload = build_shopee_payload(data)
-                    url = f"{MOCK_API_BASE_URL}/mock/shopee/api/v2/product/add_item"
-                
-                elif marketplace == "LAZADA":
-                    payload = build_lazada_payload(data)
-                    url = f"{MOCK_API_BASE_URL}/mock/lazada/product/create"
-
-                # Eksekusi
-                logging.info(f"   -> Sending {action} to {marketplace}")
-                resp = requests.post(url, json=payload, timeout=10)
-                
-                # Simpan Binding (Jika Create)
-                if not is_update and resp.status_code in [200, 201]:
-                    # (Parsing ID Mock sederhana)
-                    new_id = "MOCK-123" 
-                    if marketplace == "TOKOPEDIA": new_id = str(resp.json()['data']['product_id'])
-                    elif marketplace == "SHOPEE": new_id = str(resp.json()['response']['item_id'])
-                    elif marketplace == "LAZADA": new_id = str(resp.json()['data']['item_id'])
-                    
-                    ctr.upsert_item({
-                        "id": binding_id, "master_sku": sku, "marketplace": marketplace,
-                        "external_id": new_id, "sync_status": "LINKED", "last_synced_at": get_iso_timestamp()
-                    })
+        sku = event.get('sku')
+        action = event.get('action')
+        data = event.get('data', {})
+        logging.info(f"[Sync] Processing {action} for {sku}")
 
-            except Exception as e: logging.error(f"Failed sync {marketplace}: {e}")
+        # --- LOGIKA 1: CREATE / UPDATE INFO PRODUK ---
+        if action in ["PRODUCT_CREATED", "PRODUCT_UPDATED"]:
+            sync_product(ctr, sku, action, data)
 
-    # --- LOGIKA 2: UPDATE STOCK ONLY ---
-    elif action == "STOCK_CHANGED":
-        # Cari binding yang ada
-        query = "SELECT * FROM c WHERE c.master_sku = @sku"
-        bindings = list(ctr.query_items(query=query, parameters=[{"name":"@sku", "value":sku}]))
-        
-        for b in bindings:
-            marketplace = b['marketplace']
-            ext_id = b['external_id']
+        # --- LOGIKA 2: UPDATE STOCK ONLY (dikumpulkan dulu, dikirim batch) ---
+        elif action == "STOCK_CHANGED":
+            stock_events[sku] = data
+
+    if stock_events:
+        push_stock_batches(ctr, stock_events)
+
+# ==========================================
+# 4. RECONCILIATION (Timer Trigger)
+# ==========================================
+# Push-only sync bisa drift kalau ada push yang hilang. Job ini membandingkan stok
+# marketplace vs stok internal (container inventory_items) dan hanya push selisihnya.
+INVENTORY_CONTAINER = os.environ.get("INVENTORY_CONTAINER", "inventory_items")
+RECONCILE_PAGE_SIZE = int(os.environ.get("RECONCILE_PAGE_SIZE", "1000"))
+RECONCILE_MAX_WORKERS = int(os.environ.get("RECONCILE_MAX_WORKERS", "8"))
+RECONCILE_TIME_BUDGET_SEC = int(os.environ.get("RECONCILE_TIME_BUDGET_SEC", "240"))
+CHECKPOINT_ID = "reconcile_checkpoint"
+CHECKPOINT_PK = "__reconcile__"
+
+def load_internal_stock(skus):
+    """Stok available per SKU dari InventoryService -> {sku: data ala STOCK_CHANGED}."""
+    inv_ctr = client.get_database_client(DATABASE_NAME).get_container_client(INVENTORY_CONTAINER)
+    stock = {}
+    skus = list(skus)
+    for i in range(0, len(skus), 100):
+        query = "SELECT c.sku, c.warehouse_code, c.quantity_available FROM c WHERE ARRAY_CONTAINS(@skus, c.sku) AND NOT IS_DEFINED(c.doc_type)"
+        rows = inv_ctr.query_items(query=query, parameters=[{"name": "@skus", "value": skus[i:i + 100]}], enable_cross_partition_query=True)
+        for r in rows:
+            qty = r.get('quantity_available', 0)
+            data = stock.setdefault(r['sku'], {"total_available": 0, "warehouses": []})
+            data['total_available'] += qty
+            data['warehouses'].append({"warehouse_code": r['warehouse_code'], "quantity": qty})
+    return stock
+
+def reconcile_shard(adapter, bindings, internal):
+    """Bandingkan satu shard (1 marketplace, <= stock_batch_max binding). Return list (binding, entry, fingerprint) yang drift."""
+    remote = adapter.fetch_stock(bindings)
+    diffs = []
+    for b in bindings:
+        sku = b['master_sku']
+        data = internal.get(sku)
+        if data is None or sku not in remote: continue
+        if remote[sku] != data['total_available']:
+            entry = adapter.build_stock_entry(b, data)
+            diffs.append((b, entry, payload_hash(entry)))
+    return diffs
+
+def reconcile_page(ctr, page):
+    internal = load_internal_stock({b['master_sku'] for b in page})
+
+    # Shard: per (marketplace, toko), ukuran sesuai batch max adapter
+    shards = []
+    by_shop = {}
+    for b in page:
+        adapter = ADAPTERS.get(b['marketplace'])
+        if adapter:
+            by_shop.setdefault((b['marketplace'], adapter.shop_of(b)), []).append(b)
+    for (marketplace, _), items in by_shop.items():
+        adapter = ADAPTERS[marketplace]
+        for i in range(0, len(items), adapter.stock_batch_max):
+            shards.append((adapter, items[i:i + adapter.stock_batch_max]))
+
+    groups = {}
+    with ThreadPoolExecutor(max_workers=RECONCILE_MAX_WORKERS) as pool:
+        futures = {pool.submit(reconcile_shard, adapter, items, internal): adapter for adapter, items in shards}
+        for fut in as_completed(futures):
             try:
-                url, payload = "", {}
-                # Ambil Total Available dari payload Inventory Service
-                total_qty = data.get('total_available', 0)
-                
-                if marketplace == "TOKOPEDIA":
-                    # Tokopedia butuh array warehouse
-                    inv_list = []
-                    for w in data.get('warehouses', []):
-                        inv_list.append({"warehouse_id": w['warehouse_code'], "quantity": w['quantity']})
-                    url = f"{MOCK_API_BASE_URL}/mock/tokopedia/product/202309/products/{ext_id}/inventory/update"
-                    payload = { "skus": [{ "inventory": inv_list }] }
-
-                elif marketplace == "SHOPEE":
-                    url = f"{MOCK_API_BASE_URL}/mock/shopee/api/v2/product/update_stock"
-                    payload = { "item_id": int(ext_id), "stock_list": [{"seller_stock": [{"stock": total_qty}]}] }
-
-                elif marketplace == "LAZADA":
-                    url = f"{MOCK_API_BASE_URL}/mock/lazada/product/price_quantity/update"
-                    payload = { "payload": { "Skus": [{ "SellerSku": sku, "Quantity": total_qty }] } }
-
-                requests.post(url, json=payload, timeout=5)
-                logging.info(f"   -> Pushed Stock {total_qty} to {marketplace}")
-                
-            except Exception as e: logging.error(f"Failed stock push {marketplace}: {e}")
+                for b, entry, fingerprint in fut.result():
+                    groups.setdefault((b['marketplace'], futures[fut].shop_of(b)), []).append((b, entry, fingerprint))
+            except Exception as e:
+                logging.error(f"[Reconcile] Shard {futures[fut].name} failed: {e}")
+
+    # Push hanya yang drift (tanpa cek fingerprint, karena justru marketplace yang beda)
+    send_stock_groups(ctr, groups)
+    return sum(len(v) for v in groups.values())
+
+@app.schedule(schedule="0 */30 * * * *", arg_name="timer", run_on_startup=False, use_monitor=True)
+def reconcile_stock(timer: func.TimerRequest) -> None:
+    ctr = get_container()
+    deadline = time.monotonic() + RECONCILE_TIME_BUDGET_SEC
+
+    # Lanjutkan dari checkpoint kalau run sebelumnya kena timeout
+    try:
+        checkpoint = ctr.read_item(item=CHECKPOINT_ID, partition_key=CHECKPOINT_PK)
+    except exceptions.CosmosResourceNotFoundError:
+        checkpoint = {"id": CHECKPOINT_ID, "master_sku": CHECKPOINT_PK, "continuation": None, "processed": 0, "drifted": 0}
+    if not checkpoint.get('continuation'):
+        checkpoint.update({"started_at": get_iso_timestamp(), "processed": 0, "drifted": 0})
+
+    query = "SELECT * FROM c WHERE IS_DEFINED(c.external_id)"
+    pager = ctr.query_items(query=query, enable_cross_partition_query=True, max_item_count=RECONCILE_PAGE_SIZE).by_page(checkpoint.get('continuation'))
+
+    for page in pager:
+        page = list(page)
+        checkpoint['drifted'] += reconcile_page(ctr, page)
+        checkpoint['processed'] += len(page)
+        checkpoint['continuation'] = pager.continuation_token
+        ctr.upsert_item(checkpoint)
+
+        if not checkpoint['continuation']: break
+        if time.monotonic() > deadline:
+            logging.info(f"[Reconcile] Time budget habis, lanjut run berikutnya ({checkpoint['processed']} bindings so far)")
+            return
+
+    checkpoint.update({"continuation": None, "last_completed_at": get_iso_timestamp()})
+    ctr.upsert_item(checkpoint)
+    logging.info(f"[Reconcile] Done: {checkpoint['processed']} bindings, {checkpoint['drifted']} drift pushed")
 
 # import azure.functions as func
 # import logging
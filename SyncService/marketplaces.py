@@ -0,0 +1,271 @@
+# marketplaces.py
+# Adapter per marketplace: payload builder, endpoint, parsing ID, batch limit & rate limit.
+# Tambah channel baru (TikTok Shop, Blibli, ...) cukup bikin class baru + @register_adapter,
+# dispatcher di function_app.py tidak perlu diubah.
+import os
+import threading
+from abc import ABC, abstractmethod
+import time
+import requests
+
+ADAPTER_CLASSES = {}
+
+def register_adapter(cls):
+    ADAPTER_CLASSES[cls.name] = cls
+    return cls
+
+def build_adapters(base_url, session=None):
+    """Instansiasi semua adapter terdaftar -> dict {marketplace: adapter} untuk lookup O(1)."""
+    session = session or requests.Session()
+    return {name: cls(base_url, session) for name, cls in ADAPTER_CLASSES.items()}
+
+class RateLimiter:
+    """Token bucket sederhana (thread-safe). rate = request per detik."""
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class MarketplaceAdapter(ABC):
+    name = ""
+    stock_batch_max = 1
+    rate_limit_per_sec = 10
+
+    def __init__(self, base_url, session):
+        self.base_url = base_url
+        self.session = session
+        rate = os.environ.get(f"{self.name}_RATE_LIMIT_PER_SEC", self.rate_limit_per_sec)
+        self.limiter = RateLimiter(rate)
+        # Rate limit marketplace dihitung per toko (header X-Shop-Id); binding boleh punya shop_id sendiri
+        self.shop_id = os.environ.get(f"{self.name}_SHOP_ID") or os.environ.get("DEFAULT_SHOP_ID", "default")
+
+    def shop_of(self, binding=None):
+        return (binding or {}).get('shop_id') or self.shop_id
+
+    # --- Product ---
+    @abstractmethod
+    def build_payload(self, data):
+        ...
+
+    @abstractmethod
+    def product_url(self, ext_id=None):
+        ...
+
+    @abstractmethod
+    def extract_id(self, body):
+        ...
+
+    # --- Stock ---
+    @abstractmethod
+    def build_stock_entry(self, binding, data):
+        ...
+
+    @abstractmethod
+    def stock_request(self, chunk):
+        """chunk: list of (binding, entry). Return (url, body) untuk satu request batch."""
+
+    def stock_errors(self, chunk, body):
+        """Mapping error per item di response -> {sku: message}."""
+        return {}
+
+    @abstractmethod
+    def fetch_stock(self, bindings, timeout=10):
+        """Ambil stok yang sedang tampil di marketplace (bulk, binding dari 1 toko) -> {sku: qty}."""
+
+    # --- Transport ---
+    def send(self, url, payload, timeout=10, shop_id=None):
+        self.limiter.acquire()
+        return self.session.post(url, json=payload, timeout=timeout, headers={"X-Shop-Id": shop_id or self.shop_id})
+
+    def get(self, url, timeout=10, shop_id=None):
+        self.limiter.acquire()
+        return self.session.get(url, timeout=timeout, headers={"X-Shop-Id": shop_id or self.shop_id})
+
+    def send_stock(self, chunk, timeout=10):
+        # Chunk selalu dari 1 toko (dikelompokkan per (marketplace, shop) oleh dispatcher)
+        url, body = self.stock_request(chunk)
+        resp = self.send(url, body, timeout, self.shop_of(chunk[0][0]))
+        if resp.status_code not in [200, 201]:
+            return {b['master_sku']: f"HTTP {resp.status_code}" for b, _ in chunk}
+        return self.stock_errors(chunk, resp.json())
+
+
+@register_adapter
+class TokopediaAdapter(MarketplaceAdapter):
+    name = "TOKOPEDIA"
+    stock_batch_max = 1  # inventory update per product_id
+
+    def build_payload(self, data):
+        # Mapping Warehouse Internal -> Tokopedia Inventory
+        inv_list = []
+        for w in data.get('warehouses', []):
+            inv_list.append({
+                "warehouse_id": w.get('warehouse_code', 'WH-DEFAULT'),
+                "quantity": int(w.get('quantity', 0))
+            })
+
+        return {
+            "title": data.get('name'),
+            "status": "ACTIVATE" if data.get('status') == 'ACTIVE' else "DEACTIVATE",
+            "skus": [{
+                "seller_sku": data.get('sku'),
+                "price": { "amount": str(data.get('base_price', 0)), "currency": "IDR" },
+                "inventory": inv_list
+            }],
+            "main_images": [{"urls": data.get('images', [])}]
+        }
+
+    def product_url(self, ext_id=None):
+        url = f"{self.base_url}/mock/tokopedia/product/202309/products"
+        if ext_id: url += f"/{ext_id}/inventory/update" # Mock logic terbatas
+        return url
+
+    def extract_id(self, body):
+        return str(body['data']['product_id'])
+
+    def build_stock_entry(self, binding, data):
+        inv_list = [{"warehouse_id": w['warehouse_code'], "quantity": w['quantity']} for w in data.get('warehouses', [])]
+        return {"inventory": inv_list}
+
+    def stock_request(self, chunk):
+        binding, entry = chunk[0]
+        return self.product_url(binding['external_id']), {"skus": [entry]}
+
+    def fetch_stock(self, bindings, timeout=10):
+        # Tidak ada bulk read, 1 request per product_id
+        stock = {}
+        for b in bindings:
+            resp = self.get(f"{self.base_url}/mock/tokopedia/product/202309/products/{b['external_id']}", timeout, self.shop_of(b))
+            if resp.status_code != 200: continue
+            skus = resp.json().get('data', {}).get('skus', [])
+            stock[b['master_sku']] = sum(int(i.get('quantity', 0)) for s in skus for i in s.get('inventory', []))
+        return stock
+
+
+@register_adapter
+class ShopeeAdapter(MarketplaceAdapter):
+    name = "SHOPEE"
+    stock_batch_max = int(os.environ.get("SHOPEE_STOCK_BATCH_MAX", "50"))
+
+    def build_payload(self, data):
+        # Struktur seller stock per gudang
+        seller_stock = []
+        for w in data.get('warehouses', []):
+            seller_stock.append({
+                "location_id": w.get('warehouse_code', 'WH-DEFAULT'),
+                "stock": int(w.get('quantity', 0))
+            })
+
+        # Payload Create Item
+        return {
+            "item_name": data.get('name'),
+            "item_sku": data.get('sku'),
+            "item_status": "NORMAL",
+            "original_price": int(data.get('base_price', 0)),
+            "seller_stock": seller_stock, # Format simplified untuk mock add_item
+            "image": { "image_url_list": data.get('images', []) }
+        }
+
+    def product_url(self, ext_id=None):
+        return f"{self.base_url}/mock/shopee/api/v2/product/add_item"
+
+    def extract_id(self, body):
+        return str(body['response']['item_id'])
+
+    def build_stock_entry(self, binding, data):
+        total_qty = data.get('total_available', 0)
+        return {"item_id": int(binding['external_id']), "stock_list": [{"seller_stock": [{"stock": total_qty}]}]}
+
+    def stock_request(self, chunk):
+        url = f"{self.base_url}/mock/shopee/api/v2/product/update_stock"
+        return url, {"item_list": [e for _, e in chunk]}
+
+    def stock_errors(self, chunk, body):
+        sku_by_item = {str(b['external_id']): b['master_sku'] for b, _ in chunk}
+        errors = {}
+        for f in body.get('response', {}).get('failure_list', []):
+            sku = sku_by_item.get(str(f.get('item_id')))
+            if sku: errors[sku] = f.get('failed_reason', 'unknown')
+        return errors
+
+    def fetch_stock(self, bindings, timeout=10):
+        sku_by_item = {str(b['external_id']): b['master_sku'] for b in bindings}
+        url = f"{self.base_url}/mock/shopee/api/v2/product/get_item_base_info"
+        resp = self.send(url, {"item_id_list": [int(i) for i in sku_by_item]}, timeout, self.shop_of(bindings[0]))
+        if resp.status_code != 200: return {}
+
+        stock = {}
+        for item in resp.json().get('response', {}).get('item_list', []):
+            sku = sku_by_item.get(str(item.get('item_id')))
+            if sku:
+                stock[sku] = int(item.get('stock_info_v2', {}).get('summary_info', {}).get('total_available_stock', 0))
+        return stock
+
+
+@register_adapter
+class LazadaAdapter(MarketplaceAdapter):
+    name = "LAZADA"
+    stock_batch_max = int(os.environ.get("LAZADA_STOCK_BATCH_MAX", "50"))
+
+    def build_payload(self, data):
+        # Lazada Payload dibungkus object 'payload'
+        total = sum(int(w.get('quantity', 0)) for w in data.get('warehouses', []))
+
+        return {
+            "payload": {
+                "Attributes": {
+                    "name": data.get('name'),
+                    "short_description": data.get('description', '')
+                },
+                "Skus": [{
+                    "SellerSku": data.get('sku'),
+                    "quantity": total,
+                    "price": int(data.get('base_price', 0)),
+                    "Images": data.get('images', [])
+                }]
+            }
+        }
+
+    def product_url(self, ext_id=None):
+        return f"{self.base_url}/mock/lazada/product/create"
+
+    def extract_id(self, body):
+        return str(body['data']['item_id'])
+
+    def build_stock_entry(self, binding, data):
+        return {"SellerSku": binding['master_sku'], "Quantity": data.get('total_available', 0)}
+
+    def stock_request(self, chunk):
+        url = f"{self.base_url}/mock/lazada/product/price_quantity/update"
+        return url, {"payload": {"Skus": [e for _, e in chunk]}}
+
+    def stock_errors(self, chunk, body):
+        errors = {}
+        for d in body.get('detail', []):
+            if d.get('seller_sku'): errors[d['seller_sku']] = d.get('message', 'unknown')
+        return errors
+
+    def fetch_stock(self, bindings, timeout=10):
+        url = f"{self.base_url}/mock/lazada/products/get"
+        resp = self.send(url, {"sku_seller_list": [b['master_sku'] for b in bindings]}, timeout, self.shop_of(bindings[0]))
+        if resp.status_code != 200: return {}
+
+        stock = {}
+        for p in resp.json().get('data', {}).get('products', []):
+            for s in p.get('skus', []):
+                stock[s.get('SellerSku')] = int(s.get('quantity', 0))
+        return stock
@@ -0,0 +1,122 @@
+# fakes.py
+# Fake Cosmos container (in-memory) + loader function_app per service untuk test.
+# Hanya mendukung bentuk query yang dipakai service (dicocokkan dari teks query), bukan SQL umum.
+import importlib.util
+import itertools
+import os
+import sys
+
+from azure.cosmos import exceptions
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def load_service(service, module="function_app"):
+    """Import <service>/<module>.py sebagai modul terpisah (tiap service punya function_app sendiri)."""
+    service_dir = os.path.join(ROOT, service)
+    for path in (ROOT, service_dir):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(f"_test_{service}_{module}", os.path.join(service_dir, f"{module}.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def _param(parameters, name):
+    return next((p["value"] for p in parameters or [] if p["name"] == name), None)
+
+class FakeContainer:
+    _etags = itertools.count(1)
+
+    def __init__(self, name="container", pk="sku"):
+        self.name = name
+        self.pk = pk
+        self.docs = {}  # (partition, id) -> doc
+
+    # --- point operations ---
+    def _stamp(self, doc):
+        doc = {k: v for k, v in doc.items() if not k.startswith("_")}
+        doc["_etag"] = str(next(self._etags))
+        self.docs[(doc.get(self.pk), doc["id"])] = doc
+        return dict(doc)
+
+    def create_item(self, body):
+        if (body.get(self.pk), body["id"]) in self.docs:
+            raise exceptions.CosmosResourceExistsError(status_code=409, message="conflict")
+        return self._stamp(body)
+
+    def upsert_item(self, body):
+        return self._stamp(body)
+
+    def replace_item(self, item, body, etag=None, match_condition=None, **kwargs):
+        current = self.docs.get((body.get(self.pk), item))
+        if current is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message="not found")
+        if etag is not None and current["_etag"] != etag:
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="precondition failed")
+        return self._stamp(body)
+
+    def delete_item(self, item, partition_key):
+        if self.docs.pop((partition_key, item), None) is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message="not found")
+
+    def read_item(self, item, partition_key):
+        doc = self.docs.get((partition_key, item))
+        if doc is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message="not found")
+        return dict(doc)
+
+    def execute_item_batch(self, batch_operations, partition_key):
+        """Transactional: semua operasi divalidasi dulu, baru diterapkan."""
+        staged = {k: v for k, v in self.docs.items()}
+        for index, (op, args, *rest) in enumerate(batch_operations):
+            kwargs = rest[0] if rest else {}
+            if op == "create":
+                key = (partition_key, args[0]["id"])
+                status = 409 if key in staged else None
+                staged[key] = args[0]
+            else:
+                key = (partition_key, args[0])
+                current = staged.get(key)
+                status = 404 if current is None else None
+                if status is None and op == "replace" and kwargs.get("if_match_etag") not in (None, current.get("_etag")):
+                    status = 412
+                if status is None:
+                    if op == "replace":
+                        staged[key] = args[1]
+                    elif op == "delete":
+                        staged.pop(key)
+            if status:
+                raise exceptions.CosmosBatchOperationError(
+                    error_index=index, headers={}, status_code=status, message="batch failed", operation_responses=[]
+                )
+        for key in list(self.docs):
+            if key not in staged:
+                del self.docs[key]
+        for key, doc in staged.items():
+            if self.docs.get(key) is not doc:
+                self._stamp(doc)
+
+    # --- queries ---
+    def query_items(self, query, parameters=None, partition_key=None, **kwargs):
+        docs = [dict(d) for (pk, _), d in self.docs.items() if partition_key is None or pk == partition_key]
+        if "NOT IS_DEFINED(c.doc_type)" in query:
+            docs = [d for d in docs if "doc_type" not in d]
+        if "c.doc_type = 'reservation'" in query:
+            docs = [d for d in docs if d.get("doc_type") == "reservation"]
+        for name, field in (("@order_id", "order_id"), ("@sku", "master_sku")):
+            value = _param(parameters, name)
+            if value is not None and f"= {name}" in query:
+                docs = [d for d in docs if d.get(field) == value or d.get("reference_id") == value]
+        ids = _param(parameters, "@ids")
+        if ids is not None:
+            docs = [d for d in docs if d["id"] in ids]
+        now = _param(parameters, "@now")
+        if now is not None:
+            docs = [d for d in docs if d.get("expires_at", "") <= now]
+        active = _param(parameters, "@active")
+        if active is not None:
+            docs = [d for d in docs if d.get("status", active) == active]
+        return docs
+
+def stock_rows(ctr, sku):
+    return {d["warehouse_code"]: d for (pk, _), d in ctr.docs.items() if pk == sku and "doc_type" not in d}
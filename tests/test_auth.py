@@ -0,0 +1,293 @@
+# test_auth.py
+# NativeBackend.decode: signature, alg, exp, kid & input malformed harus selalu jadi AuthError
+# (bukan AttributeError/TypeError yang bocor jadi 500), cache token LRU & require_user.
+import importlib.util
+import json
+import os
+import time
+
+import azure.functions as func
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODULE_PATHS = {
+    "utils.auth": os.path.join(ROOT, "utils", "auth.py"),
+    "ProductService.auth_utils": os.path.join(ROOT, "ProductService", "auth_utils.py"),
+}
+
+def load_module(name):
+    spec = importlib.util.spec_from_file_location(f"_test_{name.replace('.', '_')}", MODULE_PATHS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def auth():
+    # Modul baru per test -> cache token & stats bersih
+    return load_module("utils.auth")
+
+def claims_for(auth, **overrides):
+    now = int(time.time())
+    claims = {"sub": "u1", "tenantId": "T001", "roles": ["admin"], "iat": now, "nbf": now,
+              "exp": now + 3600, "iss": auth.ISSUER, "aud": auth.AUD}
+    claims.update(overrides)
+    return claims
+
+def raw_token(auth, header, payload, backend):
+    """Token dengan header/payload bebas, ditandatangani backend (signature valid)."""
+    encode = lambda obj: auth._b64(json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+    signing_input = f"{encode(header)}.{encode(payload)}"
+    return f"{signing_input}.{auth._b64(backend._sign(signing_input.encode('ascii')))}"
+
+def es256_backend(auth, monkeypatch, kid="k1"):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    pem = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode("utf-8")
+    monkeypatch.setattr(auth, "JWT_SIGNING_KEYS", json.dumps([{"kid": kid, "pem": pem}]))
+    monkeypatch.setattr(auth, "JWT_PUBLIC_KEY", None)
+    monkeypatch.setattr(auth, "JWKS_URL", None)
+    return auth.NativeBackend("ES256")
+
+def assert_auth_error(auth, backend, token, message):
+    with pytest.raises(auth.AuthError) as exc:
+        backend.decode(token)
+    assert str(exc.value) == message
+    assert exc.value.status == 401
+
+def test_roundtrip_hs256(auth):
+    backend = auth.NativeBackend("HS256")
+    claims = claims_for(auth)
+    assert backend.decode(backend.encode(claims)) == claims
+
+def test_bad_signature(auth):
+    backend = auth.NativeBackend("HS256")
+    header, payload, sig = backend.encode(claims_for(auth)).split(".")
+    forged = auth._b64(bytes(b ^ 0xFF for b in auth._unb64(sig)))
+    assert_auth_error(auth, backend, f"{header}.{payload}.{forged}", "invalid_token: signature")
+
+def test_tampered_payload(auth):
+    backend = auth.NativeBackend("HS256")
+    header, _, sig = backend.encode(claims_for(auth)).split(".")
+    payload = auth._b64(json.dumps(claims_for(auth, roles=["superadmin"])).encode("utf-8"))
+    assert_auth_error(auth, backend, f"{header}.{payload}.{sig}", "invalid_token: signature")
+
+@pytest.mark.parametrize("alg", ["none", "ES256", None])
+def test_alg_mismatch(auth, alg):
+    backend = auth.NativeBackend("HS256")
+    token = raw_token(auth, {"alg": alg, "typ": "JWT"}, claims_for(auth), backend)
+    assert_auth_error(auth, backend, token, "invalid_token: alg")
+
+def test_expired(auth):
+    backend = auth.NativeBackend("HS256")
+    token = backend.encode(claims_for(auth, exp=int(time.time()) - 10))
+    assert_auth_error(auth, backend, token, "token_expired")
+
+def test_not_yet_valid(auth):
+    backend = auth.NativeBackend("HS256")
+    token = backend.encode(claims_for(auth, nbf=int(time.time()) + 600))
+    assert_auth_error(auth, backend, token, "invalid_token: not_yet_valid")
+
+@pytest.mark.parametrize("exp", ["tomorrow", None, True, [1]])
+def test_non_numeric_exp(auth, exp):
+    backend = auth.NativeBackend("HS256")
+    token = backend.encode(claims_for(auth, exp=exp))
+    assert_auth_error(auth, backend, token, "invalid_token: exp")
+
+def test_issuer_and_audience(auth):
+    backend = auth.NativeBackend("HS256")
+    assert_auth_error(auth, backend, backend.encode(claims_for(auth, iss="other")), "invalid_token: issuer")
+    assert_auth_error(auth, backend, backend.encode(claims_for(auth, aud="other")), "invalid_token: audience")
+    assert backend.decode(backend.encode(claims_for(auth, aud=["x", auth.AUD])))["sub"] == "u1"
+
+@pytest.mark.parametrize("token", [
+    "", "abc", "a.b", "a.b.c.d", "!!!.e30.", "e30.!!!.", "bm90IGpzb24.e30.",
+])
+def test_malformed(auth, token):
+    backend = auth.NativeBackend("HS256")
+    with pytest.raises(auth.AuthError) as exc:
+        backend.decode(token)
+    assert str(exc.value).startswith("invalid_token")
+
+@pytest.mark.parametrize("token", ["W10.e30.", "MQ.e30.", "bnVsbA.e30.", "InN0ciI.e30."])
+def test_non_object_header(auth, token):
+    # header JSON valid tapi bukan object ([] / 1 / null / "str")
+    assert_auth_error(auth, auth.NativeBackend("HS256"), token, "invalid_token: malformed")
+
+@pytest.mark.parametrize("payload", [[], 1, None, "str"])
+def test_non_object_payload(auth, payload):
+    backend = auth.NativeBackend("HS256")
+    token = raw_token(auth, {"alg": "HS256", "typ": "JWT"}, payload, backend)
+    assert_auth_error(auth, backend, token, "invalid_token: payload")
+
+def test_es256_kid(auth, monkeypatch):
+    backend = es256_backend(auth, monkeypatch, kid="k1")
+    token = backend.encode(claims_for(auth))
+    assert json.loads(auth._unb64(token.split(".")[0]))["kid"] == "k1"
+    assert backend.decode(token)["sub"] == "u1"
+
+    unknown = raw_token(auth, {"alg": "ES256", "typ": "JWT", "kid": "k2"}, claims_for(auth), backend)
+    assert_auth_error(auth, backend, unknown, "invalid_token: unknown_kid")
+    missing = raw_token(auth, {"alg": "ES256", "typ": "JWT"}, claims_for(auth), backend)
+    assert_auth_error(auth, backend, missing, "invalid_token: unknown_kid")
+
+def test_es256_signature_from_other_key(auth, monkeypatch):
+    backend = es256_backend(auth, monkeypatch, kid="k1")
+    other = es256_backend(auth, monkeypatch, kid="k1")
+    assert_auth_error(auth, backend, other.encode(claims_for(auth)), "invalid_token: signature")
+
+@pytest.mark.parametrize("value", ["", "abc", "W10.", "e30.AAAA"])
+def test_internal_identity_malformed(auth, monkeypatch, value):
+    monkeypatch.setattr(auth, "INTERNAL_IDENTITY_KEY", b"k")
+    with pytest.raises(auth.AuthError):
+        auth.verify_internal_identity(value)
+
+def test_internal_identity_non_object(auth, monkeypatch):
+    import hashlib
+    import hmac
+    monkeypatch.setattr(auth, "INTERNAL_IDENTITY_KEY", b"k")
+    payload = auth._b64(b"[]")
+    sig = auth._b64(hmac.new(b"k", payload.encode("ascii"), hashlib.sha256).digest())
+    with pytest.raises(auth.AuthError):
+        auth.verify_internal_identity(f"{payload}.{sig}")
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+    def read(self):
+        return self.body
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+def verifier_backend(auth, monkeypatch, jwks=None, public_pem=None):
+    """Backend ES256 tanpa private key: verifikasi via JWKS_URL (+ JWT_PUBLIC_KEY opsional)."""
+    import urllib.request
+    def urlopen(url, timeout=None):
+        if jwks is None:
+            raise OSError("jwks unreachable")
+        return FakeResponse(json.dumps(jwks).encode("utf-8"))
+    monkeypatch.setattr(urllib.request, "urlopen", urlopen)
+    monkeypatch.setattr(auth, "JWT_SIGNING_KEYS", None)
+    monkeypatch.setattr(auth, "JWT_PRIVATE_KEY", None)
+    monkeypatch.setattr(auth, "JWT_PUBLIC_KEY", public_pem)
+    monkeypatch.setattr(auth, "JWKS_URL", "http://auth.local/jwks.json")
+    return auth.NativeBackend("ES256")
+
+def test_jwks_loaded_before_first_request(auth, monkeypatch):
+    signer = es256_backend(auth, monkeypatch, kid="k1")
+    backend = verifier_backend(auth, monkeypatch, jwks=signer.jwks_document())
+    assert set(backend.jwks.keys) == {"k1"}
+    assert not backend.jwks.refreshing
+    assert backend.decode(signer.encode(claims_for(auth)))["sub"] == "u1"
+
+def test_jwks_unreachable_falls_back_to_public_key(auth, monkeypatch):
+    from cryptography.hazmat.primitives import serialization
+    signer = es256_backend(auth, monkeypatch, kid="k1")
+    pem = signer.public_keys["k1"].public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode("utf-8")
+    backend = verifier_backend(auth, monkeypatch, jwks=None, public_pem=pem)
+    assert backend.jwks.keys == {}
+    assert backend.decode(signer.encode(claims_for(auth)))["sub"] == "u1"
+
+def test_jwks_unreachable_without_public_key(auth, monkeypatch):
+    signer = es256_backend(auth, monkeypatch, kid="k1")
+    backend = verifier_backend(auth, monkeypatch, jwks=None)
+    assert_auth_error(auth, backend, signer.encode(claims_for(auth)), "invalid_token: unknown_kid")
+
+def test_product_service_reexports_shared_auth():
+    import utils.auth
+    shim = load_module("ProductService.auth_utils")
+    for name in ["require_user", "require_role", "decode_token", "error", "AuthError"]:
+        assert getattr(shim, name) is getattr(utils.auth, name)
+
+# --- Cache token (LRU) ---
+def counting_backend(auth, monkeypatch):
+    calls = []
+    backend = auth.NativeBackend("HS256")
+    decode = backend.decode
+    monkeypatch.setattr(backend, "decode", lambda token: calls.append(token) or decode(token))
+    monkeypatch.setattr(auth, "jwt_backend", backend)
+    return backend, calls
+
+def test_cache_hit_skips_backend(auth, monkeypatch):
+    backend, calls = counting_backend(auth, monkeypatch)
+    token = backend.encode(claims_for(auth))
+    auth.decode_token(token)
+    assert auth.decode_token(token)["sub"] == "u1"
+    assert len(calls) == 1
+    info = auth.token_cache_info()
+    assert (info["hits"], info["misses"], info["size"]) == (1, 1, 1)
+
+def test_cache_expiry_matches_backend(auth, monkeypatch):
+    backend, calls = counting_backend(auth, monkeypatch)
+    exp = int(time.time()) + 60
+    token = backend.encode(claims_for(auth, exp=exp))
+    auth.decode_token(token)
+
+    # Tepat di detik exp: backend masih menerima -> cache juga harus hit
+    monkeypatch.setattr(time, "time", lambda: float(exp))
+    assert backend.decode(token)["sub"] == "u1"
+    assert auth.decode_token(token)["sub"] == "u1"
+    assert auth.token_cache_info()["hits"] == 1
+
+    # Lewat exp: ditolak dan entry dibuang dari cache
+    monkeypatch.setattr(time, "time", lambda: exp + 0.5)
+    with pytest.raises(auth.AuthError) as exc:
+        auth.decode_token(token)
+    assert str(exc.value) == "token_expired"
+    info = auth.token_cache_info()
+    assert (info["expired"], info["size"]) == (1, 0)
+    assert_auth_error(auth, backend, token, "token_expired")
+
+def test_cache_capacity_evicts_least_recently_used(auth, monkeypatch):
+    backend, calls = counting_backend(auth, monkeypatch)
+    monkeypatch.setattr(auth, "TOKEN_CACHE_SIZE", 2)
+    t1, t2, t3 = (backend.encode(claims_for(auth, sub=s)) for s in ["u1", "u2", "u3"])
+    auth.decode_token(t1)
+    auth.decode_token(t2)
+    auth.decode_token(t1)  # t1 jadi paling baru dipakai
+    auth.decode_token(t3)  # -> t2 yang dibuang
+    info = auth.token_cache_info()
+    assert (info["size"], info["evictions"]) == (2, 1)
+    calls.clear()
+    auth.decode_token(t1)
+    auth.decode_token(t2)
+    assert calls == [t2]
+
+def test_cache_disabled(auth, monkeypatch):
+    backend, calls = counting_backend(auth, monkeypatch)
+    monkeypatch.setattr(auth, "TOKEN_CACHE_SIZE", 0)
+    token = backend.encode(claims_for(auth))
+    auth.decode_token(token)
+    auth.decode_token(token)
+    assert len(calls) == 2 and auth.token_cache_info()["size"] == 0
+
+# --- require_user ---
+def request(headers):
+    return func.HttpRequest(method="GET", url="/api/x", headers=headers, body=b"")
+
+def test_require_user_prefers_internal_identity(auth, monkeypatch):
+    backend, calls = counting_backend(auth, monkeypatch)
+    monkeypatch.setattr(auth, "INTERNAL_IDENTITY_KEY", b"k")
+    identity = auth.issue_internal_identity(claims_for(auth, sub="gateway-user"))
+    bearer = "Bearer " + backend.encode(claims_for(auth, sub="bearer-user"))
+
+    claims, err = auth.require_user(request({"X-Internal-Identity": identity, "Authorization": bearer}))
+    assert err is None and claims["sub"] == "gateway-user"
+    assert calls == []  # JWT tidak di-decode sama sekali
+
+    # Identity ada tapi tidak valid -> 401, tidak jatuh ke bearer token
+    claims, err = auth.require_user(request({"X-Internal-Identity": identity + "x", "Authorization": bearer}))
+    assert claims is None and err.status_code == 401
+
+def test_require_user_ignores_identity_without_key(auth, monkeypatch):
+    backend, calls = counting_backend(auth, monkeypatch)
+    monkeypatch.setattr(auth, "INTERNAL_IDENTITY_KEY", b"")
+    bearer = "Bearer " + backend.encode(claims_for(auth, sub="bearer-user"))
+    claims, err = auth.require_user(request({"X-Internal-Identity": "forged.sig", "Authorization": bearer}))
+    assert err is None and claims["sub"] == "bearer-user"
+    assert len(calls) == 1
@@ -0,0 +1,157 @@
+# test_inventory_orders.py
+# Alur order InventoryService (reserve / cancel / complete / expire) di atas fake Cosmos.
+import json
+
+import azure.functions as func
+import pytest
+
+from fakes import FakeContainer, load_service, stock_rows
+
+@pytest.fixture
+def inv(monkeypatch):
+    fa = load_service("InventoryService")
+    containers = {
+        fa.CONTAINER_INVENTORY: FakeContainer(fa.CONTAINER_INVENTORY),
+        fa.CONTAINER_LEDGER: FakeContainer(fa.CONTAINER_LEDGER),
+        fa.CONTAINER_EXPIRY_INDEX: FakeContainer(fa.CONTAINER_EXPIRY_INDEX, pk="bucket"),
+    }
+    monkeypatch.setattr(fa, "get_container", lambda name, pk_path="/sku": containers[name])
+    fa.containers = containers
+    fa.ctr = containers[fa.CONTAINER_INVENTORY]
+    for wh, on_hand in [("WH-JKT", 3), ("WH-BDG", 10)]:
+        fa.ctr.upsert_item({
+            "id": f"A_{wh}", "sku": "A", "warehouse_code": wh, "product_name": "a",
+            "quantity_on_hand": on_hand, "quantity_reserved": 0, "quantity_available": on_hand, "safety_stock": 0
+        })
+    return fa
+
+def send(fa, **event):
+    body = json.dumps({"sku": "A", **event}).encode("utf-8")
+    fa.process_marketplace_orders(func.ServiceBusMessage(body=body))
+
+def state(fa):
+    return {wh: (r["quantity_on_hand"], r["quantity_reserved"]) for wh, r in stock_rows(fa.ctr, "A").items()}
+
+def ledger(fa, order_id):
+    return sorted(
+        (d["reason"], d["warehouse_code"], d["change_amount"])
+        for d in fa.containers[fa.CONTAINER_LEDGER].docs.values() if d["reference_id"] == order_id
+    )
+
+def expire(fa, order_id):
+    ids = [d["id"] for d in fa.ctr.docs.values() if d.get("order_id") == order_id]
+    return fa.release_expired(fa.ctr, "A", ids, "9999-12-31T00:00:00")
+
+def test_cancel_releases_reservation_once(inv):
+    send(inv, action="ORDER_CREATED", order_id="o1", quantity=2, warehouse_code="WH-BDG")
+    assert state(inv)["WH-BDG"] == (10, 2)
+    send(inv, action="ORDER_CANCELLED", order_id="o1", quantity=2)
+    send(inv, action="ORDER_CANCELLED", order_id="o1", quantity=2)  # redelivery
+    assert state(inv)["WH-BDG"] == (10, 0)
+    assert ledger(inv, "o1") == [("ORDER_CANCELLED_RESTORE", "WH-BDG", 2), ("ORDER_RESERVED", "WH-BDG", 2)]
+
+def test_cancel_after_expiry_is_noop(inv):
+    send(inv, action="ORDER_CREATED", order_id="o1", quantity=2, warehouse_code="WH-BDG")
+    assert expire(inv, "o1") == 1
+    assert state(inv)["WH-BDG"] == (10, 0)
+    send(inv, action="ORDER_CANCELLED", order_id="o1", quantity=2, warehouse_code="WH-BDG")
+    assert state(inv)["WH-BDG"] == (10, 0)
+    assert ("ORDER_CANCELLED_RESTORE", "WH-BDG", 2) not in ledger(inv, "o1")
+
+def test_complete_after_expiry_deducts_on_hand(inv):
+    send(inv, action="ORDER_CREATED", order_id="o1", quantity=2, warehouse_code="WH-BDG", price=100)
+    expire(inv, "o1")
+    send(inv, action="ORDER_COMPLETED", order_id="o1", quantity=2, price=100)
+    # hold sudah dilepas sweeper -> reserved tidak dilepas lagi, on_hand tetap dipotong
+    assert state(inv)["WH-BDG"] == (8, 0)
+    assert ("ORDER_FULFILLED", "WH-BDG", -2) in ledger(inv, "o1")
+    send(inv, action="ORDER_COMPLETED", order_id="o1", quantity=2, price=100)  # redelivery
+    assert state(inv)["WH-BDG"] == (8, 0)
+
+def test_complete_without_hold_deducts_event_warehouse(inv):
+    # Order dari sebelum ada reservasi / reserve yang gagal: tidak ada doc & tidak ada ORDER_RESERVED
+    send(inv, action="ORDER_COMPLETED", order_id="legacy", quantity=4, warehouse_code="WH-BDG", price=100)
+    assert state(inv)["WH-BDG"] == (6, 0)  # reserved di-clamp 0
+    assert ledger(inv, "legacy") == [("ORDER_FULFILLED", "WH-BDG", -4)]
+    send(inv, action="ORDER_COMPLETED", order_id="legacy", quantity=4, warehouse_code="WH-BDG", price=100)
+    assert state(inv)["WH-BDG"] == (6, 0)
+
+def test_cancel_without_hold_is_noop(inv):
+    send(inv, action="ORDER_CANCELLED", order_id="never", quantity=4, warehouse_code="WH-BDG")
+    assert state(inv)["WH-BDG"] == (10, 0)
+    assert ledger(inv, "never") == []
+
+def test_complete_split_order_without_warehouse(inv):
+    send(inv, action="ORDER_CREATED", order_id="o1", quantity=12, allocation_strategy="split")
+    assert sum(r for _, r in state(inv).values()) == 12
+    reserved = {wh: r for wh, (_, r) in state(inv).items()}
+    send(inv, action="ORDER_COMPLETED", order_id="o1", quantity=12)
+    assert state(inv) == {"WH-JKT": (3 - reserved["WH-JKT"], 0), "WH-BDG": (10 - reserved["WH-BDG"], 0)}
+
+def test_event_without_order_id_rejected(inv):
+    send(inv, action="ORDER_CREATED", quantity=2, warehouse_code="WH-BDG")
+    assert state(inv)["WH-BDG"] == (10, 0)
+    assert not [d for d in inv.ctr.docs.values() if d.get("doc_type")]
+
+def adjust(fa, **body):
+    handler = getattr(getattr(fa.adjust_inventory, "_function", None), "_func", fa.adjust_inventory)
+    req = func.HttpRequest(method="POST", url="/api/inventory/adjust", body=json.dumps({"sku": "A", **body}).encode("utf-8"))
+    return handler(req)
+
+def test_reserve_rereads_stale_cache_before_rejecting(inv):
+    inv.load_sku_rows(inv.ctr, "A")  # cache terisi: BDG available 10
+    row = dict(stock_rows(inv.ctr, "A")["WH-BDG"], quantity_on_hand=20, quantity_available=20)
+    inv.ctr.upsert_item(row)  # restock dari instance lain, cache instance ini belum tahu
+    send(inv, action="ORDER_CREATED", order_id="o1", quantity=15, warehouse_code="WH-BDG")
+    assert state(inv)["WH-BDG"] == (20, 15)
+    assert "A" not in inv.availability_cache
+
+def test_adjust_keeps_reserved(inv):
+    send(inv, action="ORDER_CREATED", order_id="o1", quantity=2, warehouse_code="WH-BDG")
+    resp = adjust(inv, warehouse_code="WH-BDG", quantity_on_hand=7)
+    assert resp.status_code == 200
+    assert json.loads(resp.get_body())["quantity_available"] == 5
+    assert state(inv)["WH-BDG"] == (7, 2)
+    assert ("MANUAL_ADJUSTMENT", "WH-BDG", -3) in ledger(inv, "Opname-API")
+
+def test_adjust_retries_when_row_changes_concurrently(inv, monkeypatch):
+    execute = inv.ctr.execute_item_batch
+    def reserve_first(batch_operations, partition_key):
+        # reserve dari instance lain masuk di antara baca & tulis adjust -> etag berubah (412)
+        monkeypatch.setattr(inv.ctr, "execute_item_batch", execute)
+        row = stock_rows(inv.ctr, "A")["WH-BDG"]
+        inv.ctr.upsert_item(dict(row, quantity_reserved=4, quantity_available=6))
+        return execute(batch_operations, partition_key)
+    monkeypatch.setattr(inv.ctr, "execute_item_batch", reserve_first)
+    assert adjust(inv, warehouse_code="WH-BDG", quantity_on_hand=12).status_code == 200
+    assert state(inv)["WH-BDG"] == (12, 4)
+
+def test_adjust_creates_missing_row(inv):
+    assert adjust(inv, warehouse_code="WH-SBY", quantity_on_hand=5, tenantId="T1").status_code == 200
+    row = stock_rows(inv.ctr, "A")["WH-SBY"]
+    assert (row["quantity_on_hand"], row["quantity_reserved"], row["tenantId"]) == (5, 0, "T1")
+    assert adjust(inv, warehouse_code="WH-SBY", quantity_on_hand=-1).status_code == 400
+
+class FakeDatabase:
+    def __init__(self, props):
+        self.props = props
+        self.created, self.replaced = [], []
+
+    def create_container_if_not_exists(self, id, partition_key, default_ttl=None):
+        self.created.append((id, default_ttl))
+        props = self.props
+        return type("Proxy", (), {"read": lambda self: dict(props, id=id)})()
+
+    def replace_container(self, container, partition_key, indexing_policy=None, default_ttl=None):
+        self.replaced.append((default_ttl, indexing_policy))
+
+def test_inventory_container_gets_default_ttl(monkeypatch):
+    fa = load_service("InventoryService")
+    db = FakeDatabase({"indexingPolicy": {"indexingMode": "consistent"}})  # container lama tanpa defaultTtl
+    monkeypatch.setattr(fa, "client", object())
+    monkeypatch.setattr(fa, "db_client", db)
+    fa.get_container(fa.CONTAINER_INVENTORY)
+    fa.get_container(fa.CONTAINER_INVENTORY)
+    fa.get_container(fa.CONTAINER_LEDGER)
+    assert db.created == [(fa.CONTAINER_INVENTORY, -1), (fa.CONTAINER_INVENTORY, -1), (fa.CONTAINER_LEDGER, None)]
+    assert db.replaced == [(-1, {"indexingMode": "consistent"})]  # sekali per proses, indexing policy dipertahankan
@@ -0,0 +1,125 @@
+# test_sync.py
+# SyncService: push produk / stok ke marketplace (adapter LAZADA) dengan session HTTP palsu.
+import json
+
+import azure.functions as func
+import pytest
+
+from fakes import FakeContainer, load_service
+
+class FakeHttpResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+class FakeSession:
+    def __init__(self):
+        self.posts = []  # (url, payload, headers)
+        self.next_id = 100
+
+    def post(self, url, json=None, timeout=None, headers=None):
+        self.posts.append((url, json, headers or {}))
+        if url.endswith("/product/create"):
+            self.next_id += 1
+            return FakeHttpResponse(200, {"data": {"item_id": self.next_id}})
+        return FakeHttpResponse(200, {})
+
+    def get(self, url, timeout=None, headers=None):
+        return FakeHttpResponse(404, {})
+
+@pytest.fixture
+def sync(monkeypatch):
+    fa = load_service("SyncService")
+    fa.session = FakeSession()
+    fa.bindings = FakeContainer("bindings", pk="master_sku")
+    monkeypatch.setattr(fa, "ADAPTERS", fa.build_adapters("http://mock", fa.session))
+    monkeypatch.setattr(fa, "get_container", lambda: fa.bindings)
+    return fa
+
+def send(fa, *events):
+    handler = getattr(getattr(fa.process_sync_events, "_function", None), "_func", fa.process_sync_events)
+    handler([func.ServiceBusMessage(body=json.dumps(e).encode("utf-8")) for e in events])
+
+def product(action, qty, name="Kopi"):
+    return {"action": action, "sku": "A", "data": {
+        "sku": "A", "name": name, "connected_channels": ["LAZADA"], "warehouses": [{"warehouse_code": "WH-JKT", "quantity": qty}]
+    }}
+
+def stock(qty):
+    return {"action": "STOCK_CHANGED", "sku": "A", "data": {
+        "total_available": qty, "warehouses": [{"warehouse_code": "WH-JKT", "quantity": qty}]
+    }}
+
+def stock_pushes(fa):
+    return [p[1]["payload"]["Skus"][0]["Quantity"] for p in fa.session.posts if "price_quantity" in p[0]]
+
+def test_stock_push_after_product_push_not_skipped(sync):
+    send(sync, product("PRODUCT_CREATED", 3))
+    send(sync, stock(3))
+    send(sync, stock(3))  # tidak berubah -> skip
+    assert stock_pushes(sync) == [3]
+
+    # Payload produk membawa stok 8 ke marketplace
+    send(sync, product("PRODUCT_UPDATED", 8))
+    send(sync, stock(3))
+    assert stock_pushes(sync) == [3, 3]
+
+def test_failed_product_push_not_counted(sync, monkeypatch):
+    monkeypatch.setattr(sync.session, "post", lambda url, **kwargs: FakeHttpResponse(500, {}))
+    send(sync, product("PRODUCT_CREATED", 3))
+    assert sync.sync_stats["pushed"] == 0
+    assert sync.bindings.docs == {}
+
+def test_missing_binding_not_cached(sync):
+    assert sync.get_bindings(sync.bindings, "A") == {}
+    assert "A" not in sync.binding_cache
+
+def test_binding_created_elsewhere_not_created_again(sync):
+    sync.get_bindings(sync.bindings, "A")
+    # Instance lain sudah create listing + binding setelah instance ini membaca
+    sync.bindings.upsert_item({"id": "LAZADA_A", "master_sku": "A", "marketplace": "LAZADA", "external_id": "7"})
+    send(sync, product("PRODUCT_UPDATED", 3))
+    # 1 POST (update; mock Lazada memakai endpoint yang sama), binding lama tidak ditimpa
+    assert [p[0] for p in sync.session.posts] == ["http://mock/mock/lazada/product/create"]
+    assert sync.bindings.read_item("LAZADA_A", "A")["external_id"] == "7"
+
+def test_pending_claim_blocks_second_create(sync):
+    sync.bindings.create_item({
+        "id": "LAZADA_A", "master_sku": "A", "marketplace": "LAZADA",
+        "sync_status": "PENDING", "claimed_at": sync.get_iso_timestamp()
+    })
+    send(sync, product("PRODUCT_CREATED", 3))
+    assert sync.session.posts == []
+
+def test_stale_claim_taken_over(sync):
+    sync.bindings.create_item({
+        "id": "LAZADA_A", "master_sku": "A", "marketplace": "LAZADA",
+        "sync_status": "PENDING", "claimed_at": "2000-01-01T00:00:00+00:00"
+    })
+    send(sync, product("PRODUCT_CREATED", 3))
+    assert sync.bindings.read_item("LAZADA_A", "A")["external_id"] == "101"
+
+def test_failed_create_releases_claim(sync, monkeypatch):
+    post = sync.session.post
+    monkeypatch.setattr(sync.session, "post", lambda url, **kwargs: FakeHttpResponse(500, {}))
+    send(sync, product("PRODUCT_CREATED", 3))
+    assert sync.bindings.docs == {}
+    monkeypatch.setattr(sync.session, "post", post)
+    send(sync, product("PRODUCT_CREATED", 3))
+    assert sync.bindings.read_item("LAZADA_A", "A")["sync_status"] == "LINKED"
+
+def test_requests_carry_shop_id(sync, monkeypatch):
+    monkeypatch.setenv("LAZADA_SHOP_ID", "lzd-1")
+    monkeypatch.setattr(sync, "ADAPTERS", sync.build_adapters("http://mock", sync.session))
+    send(sync, product("PRODUCT_CREATED", 3))
+    assert sync.bindings.read_item("LAZADA_A", "A")["shop_id"] == "lzd-1"
+
+    # Binding toko lain -> request stok dikirim dengan shop_id binding itu
+    sync.save_binding(sync.bindings, {"id": "LAZADA_B", "master_sku": "B", "marketplace": "LAZADA", "shop_id": "lzd-2", "external_id": "9"})
+    send(sync, stock(5), {**stock(6), "sku": "B"})
+    shops = [p[2]["X-Shop-Id"] for p in sync.session.posts]
+    assert shops[0] == "lzd-1"
+    assert sorted(shops[1:]) == ["lzd-1", "lzd-2"]  # 1 batch per toko
@@ -2,19 +2,306 @@
 import azure.functions as func
 import json
 import os
-from jose import jwt, JWTError, ExpiredSignatureError
+from collections import OrderedDict
+import base64
+import calendar
 import datetime
+import hashlib
+import hmac
+import threading
+import time
 
 SECRET = os.getenv("JWT_SECRET", "dev_only_secret_change_me")
 ISSUER = os.getenv("JWT_ISSUER", "inv-saas-local")
 AUD = os.getenv("JWT_AUDIENCE", "inv-saas-clients")
-ALG = "HS256"
+ALG = os.getenv("JWT_ALG", "HS256")           # HS256 | ES256 | EdDSA
+JWT_BACKEND = os.getenv("JWT_BACKEND", "native")  # native | jose
+JWT_PRIVATE_KEY = os.getenv("JWT_PRIVATE_KEY")  # PEM, untuk ES256/EdDSA (hanya AuthService)
+JWT_SIGNING_KEYS = os.getenv("JWT_SIGNING_KEYS")  # JSON keyring untuk rotasi (hanya AuthService)
+JWT_PUBLIC_KEY = os.getenv("JWT_PUBLIC_KEY")    # PEM, untuk verifikasi ES256/EdDSA tanpa kid
+JWKS_URL = os.getenv("JWKS_URL")                # .../api/auth/.well-known/jwks.json (service selain AuthService)
+JWKS_REFRESH_SEC = int(os.getenv("JWKS_REFRESH_SEC", "300"))
+JWKS_MIN_REFRESH_SEC = int(os.getenv("JWKS_MIN_REFRESH_SEC", "30"))
+
+# Cache token yang sudah diverifikasi (LRU, key = sha256(token)), berlaku sampai 'exp'
+TOKEN_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "1024"))
+_token_cache = OrderedDict()  # key -> (claims, exp)
+_token_cache_lock = threading.Lock()
+token_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+def is_expired(exp, now=None):
+    """Satu aturan exp untuk backend & cache: token berlaku sampai detik 'exp' (inklusif)."""
+    return (time.time() if now is None else now) > exp
+
+# Identitas internal dari gateway: claims + HMAC (shared key), jadi service downstream
+# tidak perlu verifikasi JWT lagi. Aktif hanya kalau INTERNAL_IDENTITY_KEY di-set.
+INTERNAL_IDENTITY_HEADER = "X-Internal-Identity"
+INTERNAL_IDENTITY_KEY = os.getenv("INTERNAL_IDENTITY_KEY", "").encode("utf-8")
+INTERNAL_IDENTITY_TTL = int(os.getenv("INTERNAL_IDENTITY_TTL_SEC", "30"))
 
 class AuthError(Exception):
     def __init__(self, message, status=401):
         super().__init__(message)
         self.status = status
 
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _numeric_date(value):
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple())
+    return value
+
+# ===== JWT BACKENDS =====
+class JoseBackend:
+    """python-jose (lama). Key & opsi diproses ulang setiap call."""
+    def __init__(self, alg):
+        from jose import jwt, JWTError, ExpiredSignatureError
+        self.alg = alg
+        self.jwt, self.JWTError, self.ExpiredSignatureError = jwt, JWTError, ExpiredSignatureError
+        self.sign_key = SECRET if alg == "HS256" else JWT_PRIVATE_KEY
+        self.verify_key = SECRET if alg == "HS256" else JWT_PUBLIC_KEY
+
+    def encode(self, payload: dict) -> str:
+        return self.jwt.encode(payload, self.sign_key, algorithm=self.alg)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return self.jwt.decode(token, self.verify_key, algorithms=[self.alg], issuer=ISSUER, audience=AUD)
+        except self.ExpiredSignatureError:
+            raise AuthError("token_expired", 401)
+        except self.JWTError as e:
+            raise AuthError(f"invalid_token: {str(e)}", 401)
+
+def _load_signing_keys():
+    """
+    Keyring private key untuk ES256/EdDSA -> list (kid, private_key), index 0 = key aktif.
+    JWT_SIGNING_KEYS='[{"kid": "2026-10", "pem": "..."}, ...]' (rotasi: tambah key baru di depan,
+    key lama tetap dipublish di JWKS sampai token lamanya expired), atau JWT_PRIVATE_KEY (1 key).
+    """
+    from cryptography.hazmat.primitives import serialization
+    entries = json.loads(JWT_SIGNING_KEYS) if JWT_SIGNING_KEYS else []
+    if not entries and JWT_PRIVATE_KEY:
+        entries = [{"pem": JWT_PRIVATE_KEY}]
+    keyring = []
+    for entry in entries:
+        key = serialization.load_pem_private_key(entry["pem"].encode("utf-8"), password=None)
+        keyring.append((entry.get("kid") or jwk_thumbprint(key.public_key()), key))
+    return keyring
+
+def public_key_to_jwk(public_key, kid=None) -> dict:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        numbers = public_key.public_numbers()
+        jwk = {"kty": "EC", "crv": "P-256", "x": _b64(numbers.x.to_bytes(32, "big")), "y": _b64(numbers.y.to_bytes(32, "big"))}
+    else:
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        jwk = {"kty": "OKP", "crv": "Ed25519", "x": _b64(raw)}
+    if kid:
+        jwk.update({"kid": kid, "alg": ALG, "use": "sig"})
+    return jwk
+
+def jwk_to_public_key(jwk: dict):
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+    if jwk.get("kty") == "EC" and jwk.get("crv") == "P-256":
+        x, y = int.from_bytes(_unb64(jwk["x"]), "big"), int.from_bytes(_unb64(jwk["y"]), "big")
+        return ec.EllipticCurvePublicNumbers(x, y, ec.SECP256R1()).public_key()
+    if jwk.get("kty") == "OKP" and jwk.get("crv") == "Ed25519":
+        return ed25519.Ed25519PublicKey.from_public_bytes(_unb64(jwk["x"]))
+    raise ValueError(f"Unsupported JWK: {jwk.get('kty')}/{jwk.get('crv')}")
+
+def jwk_thumbprint(public_key) -> str:
+    """RFC 7638 thumbprint, dipakai sebagai kid default."""
+    jwk = public_key_to_jwk(public_key)
+    canonical = json.dumps(jwk, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return _b64(hashlib.sha256(canonical).digest())
+
+class JwksCache:
+    """
+    Cache JWKS in-process (kid -> public key). Fetch pertama blocking di constructor (saat import),
+    supaya cold start tidak menolak token valid dengan unknown_kid. Refresh berikutnya jalan di
+    background thread; lookup di hot path hanya baca dict, tidak pernah menunggu network.
+    """
+    def __init__(self, url, refresh_sec=JWKS_REFRESH_SEC):
+        self.url = url
+        self.refresh_sec = refresh_sec
+        self.keys = {}
+        self.last_fetch = 0.0
+        self.lock = threading.Lock()
+        self.refreshing = True
+        self._fetch()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def _fetch(self):
+        import urllib.request
+        try:
+            with urllib.request.urlopen(self.url, timeout=5) as resp:
+                jwks = json.loads(resp.read())
+            keys = {}
+            for jwk in jwks.get("keys", []):
+                try:
+                    keys[jwk["kid"]] = jwk_to_public_key(jwk)
+                except Exception:
+                    continue
+            self.keys = keys  # swap atomik
+        except Exception:
+            pass  # pakai key lama sampai refresh berikutnya
+        finally:
+            with self.lock:
+                self.last_fetch = time.monotonic()
+                self.refreshing = False
+
+    def _loop(self):
+        while True:
+            time.sleep(self.refresh_sec)
+            with self.lock:
+                self.refreshing = True
+            self._fetch()
+
+    def refresh_async(self):
+        """Dipanggil saat ada kid asing (misal key baru hasil rotasi). Dibatasi JWKS_MIN_REFRESH_SEC."""
+        with self.lock:
+            if self.refreshing or time.monotonic() - self.last_fetch < JWKS_MIN_REFRESH_SEC:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._fetch, daemon=True).start()
+
+    def get(self, kid):
+        key = self.keys.get(kid)
+        if key is None:
+            self.refresh_async()
+        return key
+
+class NativeBackend:
+    """
+    JWT compact dengan signer/verifier yang dibuat sekali saat import:
+    HS256 -> objek HMAC yang di-copy per call, ES256/EdDSA -> key object cryptography di-cache
+    (keyring lokal dan/atau JWKS dari AuthService, lookup per kid).
+    """
+    def __init__(self, alg):
+        self.alg = alg
+        self.private_key = None
+        self.signing_kid = None
+        self.public_keys = {}  # kid -> public key (lokal)
+        self.jwks = None
+        if alg == "HS256":
+            self._mac = hmac.new(SECRET.encode("utf-8"), digestmod=hashlib.sha256)
+        elif alg in ("ES256", "EdDSA"):
+            from cryptography.hazmat.primitives import serialization
+            keyring = _load_signing_keys()
+            if keyring:
+                self.signing_kid, self.private_key = keyring[0]
+                self.public_keys = {kid: key.public_key() for kid, key in keyring}
+            if JWT_PUBLIC_KEY:
+                self.public_keys[None] = serialization.load_pem_public_key(JWT_PUBLIC_KEY.encode("utf-8"))
+            if JWKS_URL:
+                self.jwks = JwksCache(JWKS_URL)
+            if not self.public_keys and not self.jwks:
+                raise ValueError(f"JWT_SIGNING_KEYS, JWT_PRIVATE_KEY, JWT_PUBLIC_KEY atau JWKS_URL wajib untuk {alg}")
+        else:
+            raise ValueError(f"Unsupported JWT_ALG: {alg}")
+
+        header = {"alg": alg, "typ": "JWT"}
+        if self.signing_kid:
+            header["kid"] = self.signing_kid
+        self.header = _b64(json.dumps(header, separators=(",", ":")).encode("utf-8"))
+
+    def _sign(self, data: bytes) -> bytes:
+        if self.alg == "HS256":
+            mac = self._mac.copy()
+            mac.update(data)
+            return mac.digest()
+        if self.private_key is None:
+            raise AuthError("signing_key_missing", 500)
+        if self.alg == "EdDSA":
+            return self.private_key.sign(data)
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec, utils as ec_utils
+        r, s = ec_utils.decode_dss_signature(self.private_key.sign(data, ec.ECDSA(hashes.SHA256())))
+        return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+
+    def _verify(self, data: bytes, sig: bytes, public_key=None) -> bool:
+        if self.alg == "HS256":
+            return hmac.compare_digest(self._sign(data), sig)
+        from cryptography.exceptions import InvalidSignature
+        try:
+            if self.alg == "EdDSA":
+                public_key.verify(sig, data)
+            else:
+                from cryptography.hazmat.primitives import hashes
+                from cryptography.hazmat.primitives.asymmetric import ec, utils as ec_utils
+                if len(sig) != 64: return False
+                der = ec_utils.encode_dss_signature(int.from_bytes(sig[:32], "big"), int.from_bytes(sig[32:], "big"))
+                public_key.verify(der, data, ec.ECDSA(hashes.SHA256()))
+            return True
+        except InvalidSignature:
+            return False
+
+    def verify_key(self, kid):
+        key = self.public_keys.get(kid)
+        if key is None and self.jwks:
+            key = self.jwks.get(kid)
+            if key is None and not self.jwks.keys:
+                # JWKS belum berhasil di-fetch: fallback ke JWT_PUBLIC_KEY (kalau di-set)
+                key = self.public_keys.get(None)
+        return key
+
+    def jwks_document(self) -> dict:
+        return {"keys": [public_key_to_jwk(key, kid) for kid, key in self.public_keys.items() if kid]}
+
+    def encode(self, payload: dict) -> str:
+        claims = {k: _numeric_date(v) for k, v in payload.items()}
+        signing_input = f"{self.header}.{_b64(json.dumps(claims, separators=(',', ':')).encode('utf-8'))}"
+        return f"{signing_input}.{_b64(self._sign(signing_input.encode('ascii')))}"
+
+    def decode(self, token: str) -> dict:
+        try:
+            header_b64, payload_b64, sig_b64 = token.split(".")
+            header = json.loads(_unb64(header_b64))
+            signature = _unb64(sig_b64)
+        except Exception:
+            raise AuthError("invalid_token: malformed", 401)
+        if not isinstance(header, dict):
+            raise AuthError("invalid_token: malformed", 401)
+        if header.get("alg") != self.alg:
+            raise AuthError("invalid_token: alg", 401)
+
+        public_key = None
+        if self.alg != "HS256":
+            public_key = self.verify_key(header.get("kid"))
+            if public_key is None:
+                raise AuthError("invalid_token: unknown_kid", 401)
+        if not self._verify(f"{header_b64}.{payload_b64}".encode("ascii"), signature, public_key):
+            raise AuthError("invalid_token: signature", 401)
+
+        try:
+            claims = json.loads(_unb64(payload_b64))
+        except Exception:
+            raise AuthError("invalid_token: payload", 401)
+        if not isinstance(claims, dict):
+            raise AuthError("invalid_token: payload", 401)
+        for field in ("exp", "nbf"):
+            if field in claims and (isinstance(claims[field], bool) or not isinstance(claims[field], (int, float))):
+                raise AuthError(f"invalid_token: {field}", 401)
+        now = time.time()
+        if "exp" in claims and is_expired(claims["exp"], now):
+            raise AuthError("token_expired", 401)
+        if "nbf" in claims and now < claims["nbf"]:
+            raise AuthError("invalid_token: not_yet_valid", 401)
+        if claims.get("iss") != ISSUER:
+            raise AuthError("invalid_token: issuer", 401)
+        aud = claims.get("aud")
+        if aud != AUD and not (isinstance(aud, list) and AUD in aud):
+            raise AuthError("invalid_token: audience", 401)
+        return claims
+
+JWT_BACKENDS = {"native": NativeBackend, "jose": JoseBackend}
+jwt_backend = JWT_BACKENDS[JWT_BACKEND](ALG)
+
 def issue_token(user: dict, ttl_sec: int = 3600) -> str:
     now = datetime.datetime.utcnow()
 
@@ -30,22 +317,77 @@ def issue_token(user: dict, ttl_sec: int = 3600) -> str:
         "aud": AUD
     }
 
-    token = jwt.encode(payload, SECRET, algorithm=ALG)
+    token = jwt_backend.encode(payload)
     return token
 
 def decode_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            claims, exp = cached
+            if not is_expired(exp):
+                _token_cache.move_to_end(key)
+                token_cache_stats["hits"] += 1
+                return dict(claims)
+            del _token_cache[key]
+            token_cache_stats["expired"] += 1
+            raise AuthError("token_expired", 401)
+        token_cache_stats["misses"] += 1
+
+    claims = jwt_backend.decode(token)
+
+    if TOKEN_CACHE_SIZE > 0 and "exp" in claims:
+        with _token_cache_lock:
+            _token_cache[key] = (claims, claims["exp"])
+            if len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+                token_cache_stats["evictions"] += 1
+    return dict(claims)
+
+def get_jwks() -> dict:
+    """JWKS publik dari keyring lokal (kosong untuk HS256)."""
+    if isinstance(jwt_backend, NativeBackend) and jwt_backend.alg != "HS256":
+        return jwt_backend.jwks_document()
+    return {"keys": []}
+
+def token_cache_info() -> dict:
+    total = token_cache_stats["hits"] + token_cache_stats["misses"]
+    return {**token_cache_stats, "size": len(_token_cache), "hit_rate": token_cache_stats["hits"] / total if total else 0.0}
+
+def issue_internal_identity(claims: dict) -> str | None:
+    """Header value '<payload>.<sig>' untuk diteruskan gateway ke service downstream."""
+    if not INTERNAL_IDENTITY_KEY:
+        return None
+    identity = {
+        "sub": claims.get("sub"),
+        "email": claims.get("email"),
+        "tenantId": claims.get("tenantId"),
+        "roles": claims.get("roles", []),
+        "exp": min(int(time.time()) + INTERNAL_IDENTITY_TTL, int(claims.get("exp", 0)) or 2**31),
+    }
+    payload = _b64(json.dumps(identity, separators=(",", ":")).encode("utf-8"))
+    sig = _b64(hmac.new(INTERNAL_IDENTITY_KEY, payload.encode("ascii"), hashlib.sha256).digest())
+    return f"{payload}.{sig}"
+
+def verify_internal_identity(value: str) -> dict:
+    if not INTERNAL_IDENTITY_KEY:
+        raise AuthError("internal_identity_disabled", 401)
     try:
-        return jwt.decode(
-            token,
-            SECRET,
-            algorithms=[ALG],
-            issuer=ISSUER,
-            audience=AUD
-        )
-    except ExpiredSignatureError:
-        raise AuthError("token_expired", 401)
-    except JWTError as e:
-        raise AuthError(f"invalid_token: {str(e)}", 401)
+        payload, sig = value.split(".", 1)
+        expected = hmac.new(INTERNAL_IDENTITY_KEY, payload.encode("ascii"), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _unb64(sig)):
+            raise AuthError("invalid_identity", 401)
+        claims = json.loads(_unb64(payload))
+        if not isinstance(claims, dict):
+            raise AuthError("invalid_identity", 401)
+    except AuthError:
+        raise
+    except Exception:
+        raise AuthError("invalid_identity", 401)
+    if is_expired(claims.get("exp", 0)):
+        raise AuthError("identity_expired", 401)
+    return claims
 
 def get_bearer_token(auth_header: str | None) -> str | None:
     if not auth_header:
@@ -61,6 +403,14 @@ def error(msg, code):
 
 # Middleware-like helper
 def require_user(req):
+    # Request yang lewat gateway: cukup 1x HMAC, tanpa decode JWT
+    identity = req.headers.get(INTERNAL_IDENTITY_HEADER)
+    if identity and INTERNAL_IDENTITY_KEY:
+        try:
+            return verify_internal_identity(identity), None
+        except AuthError:
+            return None, error("invalid_token", 401)
+
     token = get_bearer_token(req.headers.get("Authorization"))
     if not token:
         return None, error("token_required", 401)
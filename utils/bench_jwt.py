@@ -0,0 +1,24 @@
+# bench_jwt.py
+# Micro-benchmark issue_token / decode_token per backend.
+#   python utils/bench_jwt.py                 -> backend dari env (JWT_BACKEND, JWT_ALG)
+#   JWT_BACKEND=jose python utils/bench_jwt.py
+import os, sys, time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import auth
+
+def bench(label, fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {n / elapsed:>12,.0f} ops/s  ({elapsed * 1e6 / n:.1f} us/op)")
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    user = {"userId": "u-bench", "email": "bench@example.com", "tenantId": "T001", "roles": ["Owner"]}
+    token = auth.issue_token(user)
+
+    print(f"backend={auth.JWT_BACKEND} alg={auth.ALG} n={n}")
+    bench("issue_token", lambda: auth.issue_token(user), n)
+    bench("verify (no cache)", lambda: auth.jwt_backend.decode(token), n)
+    bench("decode_token (LRU cache)", lambda: auth.decode_token(token), n)
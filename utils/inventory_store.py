@@ -0,0 +1,198 @@
+# inventory_store.py
+# Akses langsung ke Cosmos DB untuk data inventory/produk (dipakai service selain InventoryService,
+# mis. ReportService) tanpa HTTP hop ke /api/inventory.
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
+from azure.cosmos import CosmosClient, PartitionKey
+
+ENDPOINT = os.environ.get("COSMOS_ENDPOINT")
+KEY = os.environ.get("COSMOS_KEY")
+DATABASE_NAME = os.environ.get("COSMOS_DATABASE")
+CONTAINER_INVENTORY = "inventory_items"
+CONTAINER_LEDGER = "stock_ledger"
+CONTAINER_PRODUCTS = os.environ.get("PRODUCT_CONTAINER", "products")
+DEFAULT_TENANT = os.environ.get("DEFAULT_TENANT_ID", "T001")
+
+COSMOS_POOL_SIZE = int(os.environ.get("COSMOS_POOL_SIZE", "32"))
+COSMOS_CONNECT_TIMEOUT = int(os.environ.get("COSMOS_CONNECT_TIMEOUT", "5"))
+DEFAULT_PAGE_SIZE = int(os.environ.get("COSMOS_PAGE_SIZE", "1000"))
+# inventory_items juga menyimpan dokumen lain (reservasi order) di partisi /sku yang sama
+STOCK_ROWS_ONLY = "NOT IS_DEFINED(c.doc_type)"
+
+# Field yang dibaca untuk laporan (projection, bukan SELECT *)
+INVENTORY_FIELDS = [
+    "sku", "warehouse_code", "product_name", "quantity_on_hand",
+    "quantity_reserved", "quantity_available", "safety_stock", "tenantId", "last_updated"
+]
+
+_client = None
+_db = None
+_containers = {}
+_lock = threading.Lock()
+
+def get_database():
+    """1 CosmosClient per proses, koneksi HTTP di-pool (COSMOS_POOL_SIZE)."""
+    global _client, _db
+    if _db is None:
+        with _lock:
+            if _db is None:
+                try:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=COSMOS_POOL_SIZE, pool_maxsize=COSMOS_POOL_SIZE)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    _client = CosmosClient(
+                        ENDPOINT, KEY,
+                        transport=RequestsTransport(session=session, session_owner=False),
+                        connection_timeout=COSMOS_CONNECT_TIMEOUT
+                    )
+                    _db = _client.get_database_client(DATABASE_NAME)
+                except Exception as e:
+                    logging.error(f"DB Connection Error: {e}")
+                    raise e
+    return _db
+
+def get_container(container_name, partition_key=None):
+    """Container client di-cache. partition_key diisi -> auto-create kalau belum ada."""
+    ctr = _containers.get(container_name)
+    if ctr is None:
+        db = get_database()
+        if partition_key:
+            ctr = db.create_container_if_not_exists(id=container_name, partition_key=PartitionKey(path=partition_key))
+        else:
+            ctr = db.get_container_client(container_name)
+        _containers[container_name] = ctr
+    return ctr
+
+def projection(fields, alias="c"):
+    return ", ".join(f"{alias}.{f}" for f in fields)
+
+def query_pages(container, query, parameters=None, page_size=DEFAULT_PAGE_SIZE, partition_key=None):
+    """Yield list item per halaman Cosmos (memori dibatasi page_size)."""
+    kwargs = {"partition_key": partition_key} if partition_key is not None else {"enable_cross_partition_query": True}
+    pager = container.query_items(query=query, parameters=parameters or [], max_item_count=page_size, **kwargs).by_page()
+    for page in pager:
+        items = list(page)
+        if items:
+            yield items
+
+def tenant_filter(tenant_id, alias="c"):
+    """Row lama belum punya tenantId -> dianggap milik DEFAULT_TENANT."""
+    return f"({alias}.tenantId ?? @default) = @tenant", [
+        {"name": "@tenant", "value": tenant_id},
+        {"name": "@default", "value": DEFAULT_TENANT}
+    ]
+
+def iter_inventory_pages(tenant_id=None, fields=INVENTORY_FIELDS, page_size=DEFAULT_PAGE_SIZE):
+    query = f"SELECT {projection(fields)} FROM c WHERE {STOCK_ROWS_ONLY}"
+    params = []
+    if tenant_id:
+        where, params = tenant_filter(tenant_id)
+        query += f" AND {where}"
+    return query_pages(get_container(CONTAINER_INVENTORY), query, params, page_size)
+
+def load_product_prices(skus):
+    """{sku: {"name", "price"}} untuk 1 halaman SKU."""
+    query = "SELECT c.sku, c.name, c.base_price FROM c WHERE ARRAY_CONTAINS(@skus, c.sku)"
+    items = get_container(CONTAINER_PRODUCTS).query_items(
+        query=query, parameters=[{"name": "@skus", "value": list(skus)}], enable_cross_partition_query=True
+    )
+    return {i["sku"]: {"name": i.get("name"), "price": i.get("base_price") or 0} for i in items}
+
+def iter_report_rows(tenant_id=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Row inventory dalam format /api/inventory (dipakai generate_inventory_report):
+    {"sku", "warehouse_code", "product": {"name", "price"}, "available_qty", "sold_qty", "reserved_qty", "tenantId"}
+    """
+    for items in iter_inventory_pages(tenant_id, page_size=page_size):
+        products = load_product_prices({i["sku"] for i in items})
+        for i in items:
+            product = products.get(i["sku"], {})
+            yield {
+                "sku": i["sku"],
+                "warehouse_code": i.get("warehouse_code"),
+                "product": {"name": product.get("name") or i.get("product_name"), "price": product.get("price", 0)},
+                "available_qty": i.get("quantity_available", 0),
+                "sold_qty": 0,  # penjualan ada di stock_ledger / rollup, bukan di inventory_items
+                "reserved_qty": i.get("quantity_reserved", 0),
+                "tenantId": i.get("tenantId") or DEFAULT_TENANT
+            }
+
+def list_tenants():
+    query = f"SELECT DISTINCT VALUE (c.tenantId ?? @default) FROM c WHERE {STOCK_ROWS_ONLY}"
+    items = get_container(CONTAINER_INVENTORY).query_items(
+        query=query, parameters=[{"name": "@default", "value": DEFAULT_TENANT}], enable_cross_partition_query=True
+    )
+    return sorted(items)
+
+def inventory_version(tenant_id=None):
+    """
+    Version stamp inventory tenant (None = semua tenant): MAX(_ts) + jumlah row (delete tidak menaikkan _ts).
+    Dua query aggregate VALUE, tanpa membaca row.
+    """
+    where, params = STOCK_ROWS_ONLY, []
+    if tenant_id:
+        tenant_where, params = tenant_filter(tenant_id)
+        where = f"{tenant_where} AND {where}"
+    ctr = get_container(CONTAINER_INVENTORY)
+    last_ts = list(ctr.query_items(query=f"SELECT VALUE MAX(c._ts) FROM c WHERE {where}", parameters=params, enable_cross_partition_query=True))
+    count = list(ctr.query_items(query=f"SELECT VALUE COUNT(1) FROM c WHERE {where}", parameters=params, enable_cross_partition_query=True))
+    return f"{last_ts[0] if last_ts else 0}:{count[0] if count else 0}"
+
+def products_version():
+    # Perubahan harga ikut mengubah nilai laporan
+    items = list(get_container(CONTAINER_PRODUCTS).query_items(query="SELECT VALUE MAX(c._ts) FROM c", enable_cross_partition_query=True))
+    return str(items[0] if items else 0)
+
+# ===== STOCK LEDGER MOVEMENTS (dipakai rollup ReportService & ReportExportService) =====
+MOVEMENT_FIELDS = ["received", "adjusted", "reserved", "cancelled", "fulfilled", "revenue"]
+
+def ledger_price(price):
+    # price di ledger bisa angka atau object {"amount": ..., "currency": ...}
+    if isinstance(price, dict):
+        price = price.get("amount", 0)
+    try:
+        return float(price or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def accumulate_movement(m, e):
+    """Tambahkan 1 entry stock_ledger ke counter movement (MOVEMENT_FIELDS)."""
+    qty = e.get("change_amount") or 0
+    reason = e.get("reason")
+    if reason == "INITIAL_STOCK":
+        m["received"] += qty
+    elif reason == "MANUAL_ADJUSTMENT":
+        m["adjusted"] += qty
+    elif reason == "ORDER_RESERVED":
+        m["reserved"] += qty
+    elif reason in ["ORDER_CANCELLED_RESTORE", "RESERVATION_EXPIRED"]:
+        m["cancelled"] += qty
+    elif reason == "ORDER_FULFILLED":
+        m["fulfilled"] += abs(qty)
+        m["revenue"] += abs(qty) * ledger_price(e.get("price"))
+    return m
+
+def load_movements(skus, start=None, end=None, page_size=DEFAULT_PAGE_SIZE):
+    """Agregasi ledger per (sku, warehouse) untuk satu halaman SKU saja."""
+    query = "SELECT c.sku, c.warehouse_code, c.reason, c.change_amount, c.price FROM c WHERE ARRAY_CONTAINS(@skus, c.sku)"
+    params = [{"name": "@skus", "value": list(skus)}]
+    if start:
+        query += " AND c.timestamp >= @from"
+        params.append({"name": "@from", "value": start})
+    if end:
+        query += " AND c.timestamp < @to"
+        params.append({"name": "@to", "value": end})
+
+    movements = {}
+    items = get_container(CONTAINER_LEDGER).query_items(
+        query=query, parameters=params, enable_cross_partition_query=True, max_item_count=page_size
+    )
+    for e in items:
+        accumulate_movement(movements.setdefault((e["sku"], e.get("warehouse_code")), dict.fromkeys(MOVEMENT_FIELDS, 0)), e)
+    return movements